@@ -1,12 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.asyncio import AsyncSession
-from backend.database.database import get_db
+from typing import Optional, List, Tuple
+from datetime import datetime
+import base64
+from backend.database.database import get_db, AsyncSessionLocal
 from backend.database import crud
 from backend.api.users import get_current_user
+from backend.api.responses import FastJSONResponse, dumps_json
+from backend.services import write_buffer
+from backend.services.question_stats import question_stats
+from backend.config import settings
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/answers", tags=["answers"])
 
+ANSWER_FIELDS = ("id", "question_id", "answer", "date")
+
+# Максимальная длина заголовка Idempotency-Key
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
+
 
 class AnswerCreate(BaseModel):
     question_id: int
@@ -23,42 +37,218 @@ class AnswerResponse(BaseModel):
         from_attributes = True
 
 
+class AnswerSearchItem(BaseModel):
+    id: int
+    question_id: int
+    date: str
+    snippet: str
+    rank: float
+
+
+class AnswerListItem(BaseModel):
+    id: Optional[int] = None
+    question_id: Optional[int] = None
+    answer: Optional[str] = None
+    date: Optional[str] = None
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Разбирает параметр fields (через запятую) в список колонок ответа"""
+    if not fields:
+        return list(ANSWER_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in ANSWER_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [field for field in ANSWER_FIELDS if field in requested]
+
+
+def encode_cursor(date: datetime, answer_id: int) -> str:
+    """Кодирует позицию (date, id) последнего ответа страницы в непрозрачный курсор"""
+    raw = f"{date.isoformat()}|{answer_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date_str, answer_id = raw.split("|")
+        return datetime.fromisoformat(date_str), int(answer_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_search_cursor(rank: float, answer_id: int) -> str:
+    """Кодирует позицию (rank, id) последнего результата поиска в непрозрачный курсор"""
+    raw = f"search|{rank!r}|{answer_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        prefix, rank, answer_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+        if prefix != "search":
+            raise ValueError
+        return float(rank), int(answer_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def serialize_answer(row: dict, fields: List[str]) -> dict:
+    item = {field: row[field] for field in fields}
+    if "date" in item:
+        item["date"] = item["date"].isoformat() if item["date"] else ''
+    return item
+
+
+def answer_response(answer, answer_data: AnswerCreate) -> dict:
+    """Ответ на POST; ключ идемпотентности от другого вопроса - ошибка клиента"""
+    if answer.question_id != answer_data.question_id:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for another question")
+    return {
+        'id': answer.id,
+        'question_id': answer.question_id,
+        'answer': answer.answer,
+        'date': answer.date.isoformat() if answer.date else ''
+    }
+
+
 @router.post("/", response_model=AnswerResponse)
 async def create_answer(
     answer_data: AnswerCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Сохранить ответ. С заголовком Idempotency-Key повтор запроса (например, ретрай WebView)
+    возвращает уже созданный ответ без новой записи.
+    """
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+    
+    if idempotency_key:
+        answer = await crud.get_answer_by_idempotency_key(db, user.id, idempotency_key)
+        if answer:
+            return answer_response(answer, answer_data)
+    
     # Проверяем существование вопроса
     question = await crud.get_question_by_id(db, answer_data.question_id)
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     
-    answer = await crud.create_answer(
-        db,
-        user.id,
-        answer_data.question_id,
-        answer_data.answer
-    )
-    return {
-        'id': answer.id,
-        'question_id': answer.question_id,
-        'answer': answer.answer,
-        'date': answer.date.isoformat() if answer.date else ''
-    }
+    user_id = user.id
+    try:
+        answer = await write_buffer.create_answer(
+            db,
+            user_id,
+            answer_data.question_id,
+            answer_data.answer,
+            idempotency_key
+        )
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел записать ответ
+        await db.rollback()
+        answer = await crud.get_answer_by_idempotency_key(db, user_id, idempotency_key) if idempotency_key else None
+        if not answer:
+            raise
+    else:
+        question_stats.record_answered(answer_data.question_id)
+    return answer_response(answer, answer_data)
 
 
-@router.get("/", response_model=list[AnswerResponse])
+@router.get("/", response_model=list[AnswerListItem], response_model_exclude_none=True)
 async def get_my_answers(
     days: int = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    answers = await crud.get_user_answers(db, user.id, days=days)
-    return [{
-        'id': a.id,
-        'question_id': a.question_id,
-        'answer': a.answer,
-        'date': a.date.isoformat() if a.date else ''
-    } for a in answers]
+    """
+    История ответов пользователя (от новых к старым). С параметром limit или cursor - страница
+    с keyset-пагинацией по (date, id), курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+    Без них, как и раньше, отдается вся история (для больших историй - страницы или /stream).
+    Параметр fields (например, fields=id,question_id,date) позволяет не загружать полный текст ответов.
+    Строки отдаются напрямую в FastJSONResponse, без повторной валидации через response_model.
+    """
+    paginated = limit is not None or cursor is not None
+    page_size = min(limit or settings.answers_page_size, settings.answers_max_page_size)
+    if page_size < 1:
+        raise HTTPException(status_code=400, detail="limit must be >= 1")
+    
+    output_fields = parse_fields(fields)
+    # id и date нужны для курсора следующей страницы
+    columns = [field for field in ANSWER_FIELDS if field in output_fields or field in ("id", "date")]
+    before = decode_cursor(cursor) if cursor else None
+    
+    # Запрашиваем на одну запись больше, чтобы понять, есть ли следующая страница
+    rows = await crud.get_user_answers_page(
+        db, user.id, columns, page_size + 1 if paginated else None, before=before, days=days
+    )
+    has_next = paginated and len(rows) > page_size
+    if has_next:
+        rows = rows[:page_size]
+    
+    # Даты сериализуются orjson без промежуточного isoformat
+    response = FastJSONResponse([{field: row[field] for field in output_fields} for row in rows])
+    if has_next:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["date"], rows[-1]["id"])
+    return response
+
 
+@router.get("/search", response_model=list[AnswerSearchItem])
+async def search_my_answers(
+    q: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Полнотекстовый поиск по ответам пользователя (индекс FTS5): все слова запроса обязательны,
+    последнее ищется по префиксу. Результаты упорядочены по релевантности, поле snippet содержит
+    фрагмент ответа с экранированным HTML и найденными словами в <mark>...</mark>.
+    Пагинация keyset по (rank, id), курсор следующей страницы - в заголовке X-Next-Cursor.
+    """
+    page_size = min(limit or settings.answers_page_size, settings.answers_max_page_size)
+    if page_size < 1:
+        raise HTTPException(status_code=400, detail="limit must be >= 1")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    after = decode_search_cursor(cursor) if cursor else None
+    
+    try:
+        rows = await crud.search_user_answers(db, user.id, q, page_size + 1, after)
+    except OperationalError:
+        raise HTTPException(status_code=503, detail="Search is unavailable")
+    has_next = len(rows) > page_size
+    if has_next:
+        rows = rows[:page_size]
+    
+    response = FastJSONResponse(rows)
+    if has_next:
+        response.headers["X-Next-Cursor"] = encode_search_cursor(rows[-1]["rank"], rows[-1]["id"])
+    return response
+
+
+@router.get("/stream")
+async def stream_my_answers(
+    days: int = None,
+    fields: Optional[str] = None,
+    user = Depends(get_current_user)
+):
+    """
+    Потоковая выгрузка всей истории ответов в формате NDJSON (один JSON-объект на строку).
+    Ответы читаются из БД серверным курсором, поэтому память не растет с размером истории.
+    """
+    output_fields = parse_fields(fields)
+    user_id = user.id
+    
+    async def generate():
+        async with AsyncSessionLocal() as session:
+            async for row in crud.stream_user_answers(session, user_id, output_fields, days=days):
+                yield dumps_json(serialize_answer(row, output_fields)) + b"\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
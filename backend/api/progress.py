@@ -1,36 +1,78 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from backend.database.database import get_db
+from backend.database.database import get_db, AsyncSessionLocal
 from backend.services.progress_service import calculate_progress, get_weekly_summary, get_monthly_report
-from backend.api.users import get_current_user
+from backend.services.analytics_service import get_rating_trends
+from backend.services.cohort_service import iter_cohort_report, COHORT_WEEKS
+from backend.api.users import get_current_user, get_admin_user
+from backend.api.responses import cached_json_response, dumps_json
 
 router = APIRouter(prefix="/api/progress", tags=["progress"])
 
 
 @router.get("/")
 async def get_progress(
+    request: Request,
     days: int = 7,
     user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     progress = await calculate_progress(db, user.id, days=days)
-    return progress
+    return cached_json_response(request, progress)
 
 
 @router.get("/weekly")
 async def get_weekly(
+    request: Request,
     user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     summary = await get_weekly_summary(db, user.id)
-    return summary
+    return cached_json_response(request, summary)
 
 
 @router.get("/monthly")
 async def get_monthly(
+    request: Request,
     user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     report = await get_monthly_report(db, user.id)
-    return report
+    return cached_json_response(request, report)
 
+
+@router.get("/trends")
+async def get_trends(
+    request: Request,
+    days: int = 90,
+    user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Тренды оценок по всем сферам за days дней: наклон, скользящее среднее, волатильность и серия без снижения"""
+    if days < 1 or days > 3650:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 3650")
+    trends = await get_rating_trends(db, user.id, days=days)
+    return cached_json_response(request, trends)
+
+
+@router.get("/admin/cohort")
+async def get_cohort_report(
+    weeks: int = COHORT_WEEKS,
+    admin = Depends(get_admin_user)
+):
+    """
+    Когортная аналитика по всем пользователям в формате NDJSON (только для админов):
+    метрики по неделям (средние оценки сфер, активные пользователи, ответы), распределение фокус-сфер
+    и удержание по неделям регистрации. Завершенные недели берутся из результатов ночной задачи,
+    которая хранит последние COHORT_WEEKS недель.
+    """
+    if weeks < 1 or weeks > COHORT_WEEKS:
+        raise HTTPException(status_code=400, detail=f"weeks must be between 1 and {COHORT_WEEKS}")
+    
+    async def generate():
+        async with AsyncSessionLocal() as session:
+            async for row in iter_cohort_report(session, weeks):
+                yield dumps_json(row) + b"\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
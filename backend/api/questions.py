@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional, List
+from typing import Optional, List, Tuple
+import base64
 from backend.database.database import get_db
 from backend.database import crud
-from backend.services.question_service import get_daily_question_for_user, get_simple_question_for_user, get_spheres_for_rating_after_questions
+from backend.services.question_service import (
+    get_daily_question_for_user, get_simple_question_for_user, get_spheres_for_rating_after_questions,
+    invalidate_question_caches
+)
+from backend.services.question_stats import question_stats
 from backend.api.users import get_current_user, get_admin_user
+from backend.api.responses import cached_json_response
+from backend.config import settings
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/questions", tags=["questions"])
@@ -35,6 +42,33 @@ class QuestionUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+class QuestionImportItem(BaseModel):
+    id: Optional[int] = None  # Если указан - обновляется этот вопрос, иначе ищется вопрос с тем же (sphere, text)
+    sphere: str
+    text: str
+    type: str = "text"
+    is_active: bool = True
+
+
+class QuestionsImport(BaseModel):
+    questions: List[QuestionImportItem]
+
+
+class ScheduleEntryCreate(BaseModel):
+    day_number: int
+    question_id: int
+
+
+class ScheduleEntryResponse(BaseModel):
+    id: int
+    day_number: int
+    question_id: int
+    sphere: str
+    
+    class Config:
+        from_attributes = True
+
+
 @router.get("/daily", response_model=QuestionResponse)
 async def get_daily_question(
     current_sphere: Optional[str] = None,
@@ -44,6 +78,7 @@ async def get_daily_question(
     question = await get_daily_question_for_user(db, user.id, current_sphere)
     if not question:
         raise HTTPException(status_code=404, detail="No question available")
+    question_stats.record_served(user.id, question.id)
     return question
 
 
@@ -55,6 +90,7 @@ async def get_simple_question(
     question = await get_simple_question_for_user(db, user.id)
     if not question:
         raise HTTPException(status_code=404, detail="No question available")
+    question_stats.record_served(user.id, question.id)
     return question
 
 
@@ -69,16 +105,137 @@ async def get_question(
     return question
 
 
+def encode_question_cursor(sphere: str, question_id: int) -> str:
+    """Кодирует позицию (sphere, id) последнего вопроса страницы в непрозрачный курсор"""
+    return base64.urlsafe_b64encode(f"{question_id}|{sphere}".encode()).decode().rstrip("=")
+
+
+def decode_question_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        question_id, sphere = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|", 1)
+        return sphere, int(question_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def question_to_dict(question) -> dict:
+    return {
+        'id': question.id,
+        'sphere': question.sphere,
+        'text': question.text,
+        'type': question.type,
+        'is_active': question.is_active
+    }
+
+
 # Админские endpoints для управления вопросами
 @router.get("/admin/all", response_model=List[QuestionResponse])
 async def get_all_questions_admin(
+    request: Request,
     active_only: bool = False,
+    sphere: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    q: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Получить вопросы (только для админов) в порядке (sphere, id).
+    Фильтры: sphere, is_active (active_only=true - то же, что is_active=true), q - подстрока текста.
+    С параметром limit вопросы отдаются страницами с keyset-пагинацией: курсор следующей страницы
+    возвращается в заголовке X-Next-Cursor и передается в параметре cursor. Без limit - все вопросы.
+    """
+    if active_only:
+        is_active = True
+    page_size = None
+    if limit is not None or cursor:
+        page_size = min(limit or settings.questions_max_page_size, settings.questions_max_page_size)
+        if page_size < 1:
+            raise HTTPException(status_code=400, detail="limit must be >= 1")
+    
+    if page_size is None and sphere is None and is_active in (None, True) and not q:
+        questions = await crud.get_all_questions(db, active_only=bool(is_active))
+        return cached_json_response(request, [question_to_dict(question) for question in questions])
+    
+    after = decode_question_cursor(cursor) if cursor else None
+    questions = await crud.get_questions_page(
+        db,
+        limit=page_size + 1 if page_size else None,
+        after=after,
+        sphere=sphere,
+        is_active=is_active,
+        text_query=q
+    )
+    has_next = page_size is not None and len(questions) > page_size
+    if has_next:
+        questions = questions[:page_size]
+    
+    response = cached_json_response(request, [question_to_dict(question) for question in questions])
+    if has_next:
+        response.headers["X-Next-Cursor"] = encode_question_cursor(questions[-1].sphere, questions[-1].id)
+    return response
+
+
+@router.post("/admin/bulk")
+async def import_questions_admin(
+    data: QuestionsImport,
     admin = Depends(get_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Получить все вопросы (только для админов)"""
-    questions = await crud.get_all_questions(db, active_only=active_only)
-    return questions
+    """
+    Массовый импорт вопросов одной транзакцией (только для админов): вопрос с id обновляется,
+    вопрос без id обновляет существующий с тем же (sphere, text) или создается.
+    """
+    if len(data.questions) > settings.questions_bulk_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions, max {settings.questions_bulk_max_items} per request"
+        )
+    
+    known_spheres = {sphere.key for sphere in await crud.get_all_spheres(db)}
+    unknown_spheres = sorted({item.sphere for item in data.questions} - known_spheres)
+    if unknown_spheres:
+        raise HTTPException(status_code=400, detail=f"Unknown spheres: {', '.join(unknown_spheres)}")
+    
+    try:
+        result = await crud.upsert_questions(db, [item.model_dump() for item in data.questions])
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    await invalidate_question_caches()
+    return result
+
+
+# Поля сортировки статистики вопросов
+QUESTION_STATS_SORT_FIELDS = ("times_served", "times_answered", "last_served_at", "last_answered_at")
+
+
+@router.get("/admin/stats")
+async def get_question_stats_admin(
+    sphere: Optional[str] = None,
+    sort: str = "times_served",
+    limit: int = 100,
+    offset: int = 0,
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Статистика использования вопросов (только для админов): сколько раз вопрос показан, отвечен и пропущен.
+    Читается из предрасчитанной таблицы question_stats; счетчики последних секунд могут еще не быть записаны.
+    """
+    if sort not in QUESTION_STATS_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(QUESTION_STATS_SORT_FIELDS)}")
+    limit = max(1, min(limit, settings.questions_max_page_size))
+    rows = await crud.get_question_stats(db, sphere=sphere, order_by=sort, limit=limit, offset=max(offset, 0))
+    return [
+        {
+            **row,
+            'times_skipped': max(row['times_served'] - row['times_answered'], 0),
+            'answer_rate': round(row['times_answered'] / row['times_served'], 4) if row['times_served'] else None
+        }
+        for row in rows
+    ]
 
 
 @router.post("/admin/", response_model=QuestionResponse)
@@ -95,6 +252,7 @@ async def create_question_admin(
         type=question_data.type,
         is_active=question_data.is_active
     )
+    await invalidate_question_caches()
     return question
 
 
@@ -116,6 +274,7 @@ async def update_question_admin(
     )
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
+    await invalidate_question_caches()
     return question
 
 
@@ -129,9 +288,58 @@ async def delete_question_admin(
     success = await crud.delete_question(db, question_id)
     if not success:
         raise HTTPException(status_code=404, detail="Question not found")
+    await invalidate_question_caches()
     return {"message": "Question deleted successfully"}
 
 
+@router.get("/admin/schedule", response_model=List[ScheduleEntryResponse])
+async def get_schedule_admin(
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Получить расписание вопросов (только для админов)"""
+    entries = await crud.get_all_schedule_entries(db)
+    return entries
+
+
+@router.post("/admin/schedule", response_model=ScheduleEntryResponse)
+async def create_schedule_entry_admin(
+    entry_data: ScheduleEntryCreate,
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Добавить вопрос в расписание на указанный день (только для админов)"""
+    if entry_data.day_number < 1:
+        raise HTTPException(status_code=400, detail="day_number must be >= 1")
+    
+    question = await crud.get_question_by_id(db, entry_data.question_id)
+    if not question:
+        raise HTTPException(status_code=404, detail="Question not found")
+    
+    entry = await crud.create_question_schedule_entry(
+        db,
+        day_number=entry_data.day_number,
+        question_id=question.id,
+        sphere=question.sphere
+    )
+    await invalidate_question_caches()
+    return entry
+
+
+@router.delete("/admin/schedule/{entry_id}")
+async def delete_schedule_entry_admin(
+    entry_id: int,
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Удалить запись из расписания вопросов (только для админов)"""
+    success = await crud.delete_question_schedule_entry(db, entry_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Schedule entry not found")
+    await invalidate_question_caches()
+    return {"message": "Schedule entry deleted successfully"}
+
+
 @router.get("/spheres-for-rating", response_model=List[str])
 async def get_spheres_for_rating(
     user = Depends(get_current_user),
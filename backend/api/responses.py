@@ -0,0 +1,71 @@
+import hashlib
+import json
+from datetime import date, datetime
+from typing import Any
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson указан в зависимостях, но приложение работает и без него
+    orjson = None
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_json(content: Any) -> bytes:
+    """Сериализует данные в JSON (байты) через orjson, datetime и date записываются в ISO-формате"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_json_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON-ответ на orjson: сериализует dict/list сразу в байты и сам преобразует datetime в ISO-строку.
+    Используется как класс ответа по умолчанию. Если orjson не установлен, используется стандартный json.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Слабое сравнение ETag из заголовка If-None-Match (RFC 9110)"""
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any((tag[2:] if tag.startswith("W/") else tag) == opaque for tag in tags)
+
+
+def cached_json_response(
+    request: Request,
+    content: Any,
+    cache_control: str = "private, no-cache"
+) -> Response:
+    """
+    JSON-ответ с ETag по содержимому и заголовком Cache-Control.
+    Если ETag совпадает с If-None-Match из запроса, возвращает 304 без тела.
+    ETag слабый, так как тело может дополнительно сжиматься GZipMiddleware.
+    """
+    response = FastJSONResponse(content)
+    etag = 'W/"' + hashlib.blake2b(response.body, digest_size=16).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return response
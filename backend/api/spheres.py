@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database.database import get_db
 from backend.database import crud
 from backend.api.users import get_current_user, get_admin_user
+from backend.api.responses import FastJSONResponse, cached_json_response
+from backend.services.question_service import invalidate_question_caches
+from backend.services import write_buffer
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -34,20 +37,31 @@ class SphereResponse(BaseModel):
         from_attributes = True
 
 
+def sphere_to_dict(sphere) -> dict:
+    """Сфера для ответа API (даты сериализует FastJSONResponse)"""
+    return {
+        'id': sphere.id,
+        'key': sphere.key,
+        'name': sphere.name,
+        'color': sphere.color,
+        'created_at': sphere.created_at,
+        'updated_at': sphere.updated_at
+    }
+
+
 @router.post("/ratings")
 async def create_sphere_ratings(
     data: SphereRatingsCreate,
     user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    spheres = await write_buffer.create_user_spheres(
+        db,
+        user.id,
+        [(rating_data.sphere, rating_data.rating) for rating_data in data.ratings]
+    )
     results = []
-    for rating_data in data.ratings:
-        sphere = await crud.create_user_sphere(
-            db,
-            user.id,
-            rating_data.sphere,
-            rating_data.rating
-        )
+    for sphere in spheres:
         results.append({
             'id': sphere.id,
             'sphere': sphere.sphere,
@@ -63,12 +77,12 @@ async def get_sphere_ratings(
     db: AsyncSession = Depends(get_db)
 ):
     spheres = await crud.get_latest_user_spheres(db, user.id)
-    return [{
+    return FastJSONResponse([{
         'id': s.id,
         'sphere': s.sphere,
         'rating': s.rating,
-        'date': s.date.isoformat()
-    } for s in spheres]
+        'date': s.date
+    } for s in spheres])
 
 
 @router.put("/focus")
@@ -134,18 +148,12 @@ async def get_spheres_for_rating_after_questions_endpoint(
 
 @router.get("/all", response_model=List[SphereResponse])
 async def get_all_spheres(
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """Получить все сферы (публичный endpoint для всех пользователей)"""
     spheres = await crud.get_all_spheres(db)
-    return [{
-        'id': s.id,
-        'key': s.key,
-        'name': s.name,
-        'color': s.color,
-        'created_at': s.created_at.isoformat(),
-        'updated_at': s.updated_at.isoformat()
-    } for s in spheres]
+    return cached_json_response(request, [sphere_to_dict(s) for s in spheres], cache_control="public, no-cache")
 
 
 # Admin endpoints для управления сферами
@@ -162,19 +170,13 @@ class SphereUpdate(BaseModel):
 
 @router.get("/admin/all", response_model=List[SphereResponse])
 async def get_all_spheres_admin(
+    request: Request,
     admin = Depends(get_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Получить все сферы (только для админов)"""
     spheres = await crud.get_all_spheres(db)
-    return [{
-        'id': s.id,
-        'key': s.key,
-        'name': s.name,
-        'color': s.color,
-        'created_at': s.created_at.isoformat(),
-        'updated_at': s.updated_at.isoformat()
-    } for s in spheres]
+    return cached_json_response(request, [sphere_to_dict(s) for s in spheres])
 
 
 @router.post("/admin/", response_model=SphereResponse)
@@ -233,5 +235,6 @@ async def delete_sphere_admin(
     if not success:
         raise HTTPException(status_code=404, detail="Сфера не найдена")
     
+    await invalidate_question_caches()
     return {"message": "Сфера успешно удалена"}
 
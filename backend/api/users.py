@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
+from typing import Optional, Tuple
+from functools import lru_cache
+import ipaddress
+import math
+import os
 import random
 from datetime import datetime
-from backend.database.database import get_db
+from backend.database.database import get_db, AsyncSessionLocal
 from backend.database import crud
 from backend.services.telegram_auth import validate_telegram_init_data
+from backend.services.export_service import iter_user_export, EXPORT_FORMATS
+from backend.services import archive_service, guest_gc_service
+from backend.services.rate_limit import check_guest_creation
 from backend.config import settings
 from pydantic import BaseModel
 
@@ -57,6 +65,46 @@ def get_client_ip(request: Request) -> str:
     return "unknown"
 
 
+@lru_cache(maxsize=1)
+def _trusted_proxy_networks(trusted_proxies: str) -> Tuple:
+    networks = []
+    for value in trusted_proxies.split(","):
+        try:
+            networks.append(ipaddress.ip_network(value.strip(), strict=False))
+        except ValueError:
+            continue
+    return tuple(networks)
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _trusted_proxy_networks(settings.trusted_proxies))
+
+
+def get_rate_limit_ip(request: Request) -> str:
+    """
+    IP адрес клиента для лимитов запросов. Заголовки X-Real-IP и X-Forwarded-For может подставить любой клиент,
+    поэтому они учитываются, только если запрос пришел от доверенного прокси (TRUSTED_PROXIES).
+    """
+    peer = request.client.host if request.client else None
+    if not peer or not _is_trusted_proxy(peer):
+        return peer or "unknown"
+    
+    real_ip = request.headers.get("X-Real-IP")
+    if real_ip:
+        return real_ip.strip()
+    
+    # Ближайший к нам адрес цепочки, добавленный не доверенным прокси
+    forwarded_for = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+    for ip in reversed(forwarded_for):
+        if not _is_trusted_proxy(ip):
+            return ip
+    return peer
+
+
 async def get_current_user(
     request: Request,
     init_data: Optional[str] = Header(None, alias="X-Telegram-Init-Data"),
@@ -89,6 +137,9 @@ async def get_current_user(
             # Пытаемся найти пользователя по ID
             user = await crud.get_user_by_id(db, guest_id)
             if user:
+                # Демо-данные создаются только для клиентов, сохранивших ID гостя (не для ботов и проб)
+                if user.demo_data_pending:
+                    await crud.materialize_guest_demo_data(db, user)
                 return user
         except (ValueError, TypeError):
             pass
@@ -101,8 +152,17 @@ async def get_current_user(
     if user:
         return user
     
-    # Создаем нового гостевого пользователя с тестовыми данными
-    user = await crud.create_guest_user_with_test_data(db, ip_address)
+    # Ограничиваем частоту создания гостей, чтобы всплеск анонимного трафика не занимал запись в БД
+    retry_after = await check_guest_creation(get_rate_limit_ip(request))
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many guest users created, try again later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+    
+    # Создаем нового гостевого пользователя (одна вставка, без демо-данных)
+    user = await crud.create_guest_user(db, ip_address)
     
     return user
 
@@ -163,57 +223,37 @@ async def update_profile(
 
 @router.get("/me/export")
 async def export_user_data(
-    user = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    export_format: str = Query("json", alias="format"),
+    user = Depends(get_current_user)
 ):
-    """Экспорт данных пользователя"""
-    # Получаем все данные пользователя
-    user_spheres = await crud.get_user_spheres(db, user.id)
-    answers = await crud.get_user_answers(db, user.id)
-    focus_spheres = await crud.get_user_focus_spheres(db, user.id)
-    settings = await crud.get_user_settings(db, user.id)
+    """
+    Экспорт данных пользователя в формате json (по умолчанию), ndjson или csv.
+    Данные отдаются потоком и сжимаются gzip, если клиент это поддерживает.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}")
     
-    # Формируем JSON для экспорта
-    export_data = {
-        "user": {
-            "id": user.id,
-            "telegram_id": user.telegram_id,
-            "username": user.username,
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-            "name": user.name,
-            "gender": user.gender,
-            "birth_date": user.birth_date.isoformat() if user.birth_date else None,
-            "created_at": user.created_at.isoformat() if user.created_at else None
-        },
-        "spheres": [
-            {
-                "sphere": sphere.sphere,
-                "rating": sphere.rating,
-                "date": sphere.date.isoformat() if sphere.date else None
-            }
-            for sphere in user_spheres
-        ],
-        "answers": [
-            {
-                "question_id": answer.question_id,
-                "answer": answer.answer,
-                "date": answer.date.isoformat() if answer.date else None
-            }
-            for answer in answers
-        ],
-        "focus_spheres": [sphere.sphere for sphere in focus_spheres],
-        "settings": {
-            "notification_time": settings.notification_time if settings else None,
-            "language": settings.language if settings else None,
-            "is_paused": settings.is_paused if settings else None,
-            "weekly_report_frequency": settings.weekly_report_frequency if settings else None,
-            "reminder_frequency": settings.reminder_frequency if settings else None,
-            "dark_theme": settings.dark_theme if settings else None
-        }
-    }
+    compress = "gzip" in request.headers.get("accept-encoding", "").lower()
+    
+    async def generate():
+        # Отдельная сессия живет до конца передачи ответа
+        async with AsyncSessionLocal() as session:
+            async for chunk in iter_user_export(session, user, export_format, compress=compress):
+                yield chunk
     
-    return export_data
+    headers = {"Vary": "Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    if export_format != "json":
+        headers["Content-Disposition"] = f'attachment; filename="user_data_{user.id}.{export_format}"'
+    
+    media_types = {
+        "json": "application/json",
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv; charset=utf-8"
+    }
+    return StreamingResponse(generate(), media_type=media_types[export_format], headers=headers)
 
 
 @router.get("/onboarding-status")
@@ -254,3 +294,72 @@ async def generate_test_data(
     
     return {"message": "Test data generated successfully"}
 
+
+# Админские endpoints для массового экспорта данных всех пользователей
+@router.post("/admin/export-jobs")
+async def create_export_job(
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Запустить фоновый экспорт данных всех пользователей в сжатые NDJSON-файлы (только для админов)"""
+    export_root = archive_service.get_export_root()
+    job = await crud.create_export_job(db, output_dir=export_root, created_by=admin.id)
+    job.output_dir = os.path.join(export_root, f"job_{job.id}")
+    await db.commit()
+    
+    await archive_service.start_export_job(job.id)
+    await db.refresh(job)
+    return archive_service.export_job_to_dict(job)
+
+
+@router.get("/admin/export-jobs")
+async def get_export_jobs(
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Получить последние задачи массового экспорта (только для админов)"""
+    jobs = await crud.get_export_jobs(db)
+    return [archive_service.export_job_to_dict(job) for job in jobs]
+
+
+@router.get("/admin/export-jobs/{job_id}")
+async def get_export_job(
+    job_id: int,
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Получить прогресс задачи массового экспорта (только для админов)"""
+    job = await crud.get_export_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return archive_service.export_job_to_dict(job)
+
+
+@router.post("/admin/export-jobs/{job_id}/resume")
+async def resume_export_job(
+    job_id: int,
+    admin = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Продолжить прерванную или завершившуюся ошибкой задачу экспорта с места остановки (только для админов)"""
+    job = await crud.get_export_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.status == "completed":
+        raise HTTPException(status_code=400, detail="Export job is already completed")
+    if not await archive_service.start_export_job(job.id):
+        raise HTTPException(status_code=400, detail="Export job is already running")
+    await db.refresh(job)
+    return archive_service.export_job_to_dict(job)
+
+
+
+@router.post("/admin/guest-gc")
+async def run_guest_gc(
+    ttl_days: Optional[int] = Query(None, description="Удалять гостей без активности дольше этого срока (по умолчанию GUEST_TTL_DAYS)"),
+    admin = Depends(get_admin_user)
+):
+    """Удалить неактивных гостевых пользователей и вернуть количество удаленных строк (только для админов)"""
+    if ttl_days is not None and ttl_days < 1:
+        raise HTTPException(status_code=400, detail="ttl_days must be at least 1")
+    return await guest_gc_service.run_guest_gc(ttl_days)
@@ -15,6 +15,31 @@ class Settings(BaseSettings):
     backend_url: str = "http://localhost:8000"
     environment: str = "development"
     admins: str = ""  # Список telegram_id админов через запятую
+    answers_page_size: int = 50  # Размер страницы истории ответов по умолчанию
+    answers_max_page_size: int = 500  # Максимальный размер страницы истории ответов
+    questions_max_page_size: int = 500  # Максимальный размер страницы списка вопросов в админке
+    questions_bulk_max_items: int = 10000  # Максимум вопросов в одном запросе массового импорта
+    export_dir: str = "exports"  # Каталог для файлов массового экспорта (относительно корня проекта)
+    export_batch_users: int = 500  # Количество пользователей в одной пачке массового экспорта
+    gzip_minimum_size: int = 1024  # Минимальный размер ответа в байтах для сжатия gzip
+    cache_backend: str = "memory"  # Хранилище кэша отчетов: memory (в памяти процесса) или redis
+    redis_url: Optional[str] = None  # Адрес Redis для cache_backend=redis, например redis://localhost:6379/0
+    progress_cache_ttl: int = 300  # Время жизни отчетов о прогрессе в кэше (секунды)
+    progress_cache_max_users: int = 10000  # Максимум пользователей в кэше отчетов в памяти
+    rate_limit_backend: str = "memory"  # Хранилище лимитов запросов: memory (в памяти процесса) или redis (общее для воркеров)
+    guest_rate_limit_per_minute: float = 5  # Создание гостей: пополнение токенов в минуту на один IP
+    guest_rate_limit_burst: int = 10  # Создание гостей: максимум запросов подряд с одного IP
+    guest_rate_limit_global_per_minute: float = 300  # Создание гостей: пополнение токенов в минуту на все IP вместе
+    guest_rate_limit_global_burst: int = 100  # Создание гостей: максимум запросов подряд со всех IP
+    trusted_proxies: str = "127.0.0.0/8,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"  # Прокси, от которых принимаются X-Real-IP / X-Forwarded-For для лимитов
+    guest_ttl_days: int = 30  # Гости без ответов и оценок дольше этого срока удаляются ночной задачей (0 - не удалять)
+    guest_gc_batch_size: int = 200  # Количество гостей, удаляемых в одной транзакции
+    write_buffer_enabled: bool = False  # Групповой коммит ответов и оценок сфер из параллельных запросов
+    write_buffer_max_delay_ms: int = 5  # Максимальное ожидание накопления пачки перед коммитом (мс)
+    write_buffer_max_rows: int = 200  # Максимум операций в одной транзакции группового коммита
+    question_stats_flush_seconds: int = 30  # Период записи накопленной статистики вопросов в БД (секунды)
+    web_concurrency: int = 1  # Количество воркеров uvicorn (переменную WEB_CONCURRENCY читает и сам uvicorn)
+    cache_sync_interval_ms: int = 200  # При нескольких воркерах: как часто воркер проверяет журнал сбросов кэшей (мс)
     
     @model_validator(mode='after')
     def set_secret_key(self):
@@ -74,6 +99,12 @@ class Settings(BaseSettings):
         
         return self
     
+    def get_database_path(self) -> Optional[str]:
+        """Путь к файлу БД SQLite (None для других СУБД)"""
+        if not self.database_url.startswith("sqlite+aiosqlite:///"):
+            return None
+        return self.database_url.replace("sqlite+aiosqlite:///", "")
+    
     def get_admin_ids(self) -> List[int]:
         """Возвращает список ID админов"""
         if not self.admins:
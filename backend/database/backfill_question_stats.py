@@ -0,0 +1,67 @@
+"""
+Заполнение таблицы question_stats для вопросов, у которых еще нет статистики.
+Число ответов берется из истории ответов (GROUP BY по индексу ix_answers_question_id).
+Показы до появления статистики не записывались, поэтому каждый отвеченный вопрос считается показанным.
+Выполняется один раз: после заполнения в таблицу data_migrations записывается отметка, иначе ответы,
+которые воркеры еще не записали из памяти в question_stats, были бы посчитаны дважды.
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+# Отметка о выполненном заполнении в таблице data_migrations
+MARKER = "backfill_question_stats"
+
+
+async def backfill():
+    """Считает статистику по истории ответов для вопросов без строки в question_stats"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование таблицы
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='question_stats'"
+        )
+        if not await cursor.fetchone():
+            print("Таблица question_stats не найдена, пропускаем заполнение")
+            return
+        
+        await db.execute(
+            "CREATE TABLE IF NOT EXISTS data_migrations (name VARCHAR PRIMARY KEY, applied_at DATETIME NOT NULL)"
+        )
+        cursor = await db.execute("SELECT name FROM data_migrations WHERE name = ?", (MARKER,))
+        if await cursor.fetchone():
+            return
+        
+        cursor = await db.execute(
+            "INSERT INTO question_stats "
+            "(question_id, times_served, times_answered, last_served_at, last_answered_at) "
+            "SELECT a.question_id, COUNT(*), COUNT(*), MAX(a.date), MAX(a.date) "
+            "FROM answers a JOIN questions q ON q.id = a.question_id "
+            "WHERE a.question_id NOT IN (SELECT question_id FROM question_stats) "
+            "GROUP BY a.question_id"
+        )
+        filled = cursor.rowcount
+        await db.execute(
+            "INSERT INTO data_migrations (name, applied_at) VALUES (?, datetime('now'))", (MARKER,)
+        )
+        
+        await db.commit()
+        if filled and filled > 0:
+            print(f"Статистика посчитана для {filled} вопросов")
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -0,0 +1,82 @@
+"""
+Заполнение таблицы user_streaks (серии ответов и счетчики активности) для пользователей, у которых ее еще нет.
+Один проход по ответам, упорядоченным по (user_id, date), с использованием индекса ix_answers_user_date.
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+from datetime import date
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+from backend.database.crud import advance_streak
+
+# Количество строк user_streaks в одной пачке вставки
+BATCH_SIZE = 1000
+
+
+async def backfill():
+    """Считает серии ответов для пользователей без строки в user_streaks"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование таблицы
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='user_streaks'"
+        )
+        if not await cursor.fetchone():
+            print("Таблица user_streaks не найдена, пропускаем заполнение")
+            return
+        
+        cursor = await db.execute(
+            "SELECT user_id, date FROM answers "
+            "WHERE user_id NOT IN (SELECT user_id FROM user_streaks) "
+            "ORDER BY user_id, date"
+        )
+        
+        rows = []
+        filled = 0
+        state = None
+        
+        async def flush():
+            await db.executemany(
+                "INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_answer_day, total_answers) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(s[0], s[1], s[2], s[3].isoformat(), s[4]) for s in rows]
+            )
+            rows.clear()
+        
+        async for user_id, answered_at in cursor:
+            if state is None or state[0] != user_id:
+                if state is not None:
+                    rows.append(state)
+                    filled += 1
+                    if len(rows) >= BATCH_SIZE:
+                        await flush()
+                state = [user_id, 0, 0, None, 0]
+            day = date.fromisoformat(answered_at[:10])
+            state[1], state[2], state[3] = advance_streak(state[1], state[2], state[3], day)
+            state[4] += 1
+        
+        if state is not None:
+            rows.append(state)
+            filled += 1
+        if rows:
+            await flush()
+        
+        await db.commit()
+        if filled:
+            print(f"Серии ответов посчитаны для {filled} пользователей")
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
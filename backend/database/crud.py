@@ -1,12 +1,23 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, delete
-from typing import List, Optional
-from datetime import datetime, timedelta
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import select, insert, and_, or_, delete, update, func, text, bindparam, DateTime
+from typing import Dict, List, Optional, Tuple, AsyncIterator
+from datetime import datetime, timedelta, date as date_type
+import html
+import json
 import random
+import re
 from backend.database.models import (
     User, UserSphere, Question, Answer, 
-    UserFocusSphere, Subscription, UserSettings, Sphere, QuestionSchedule
+    UserFocusSphere, Subscription, UserSettings, Sphere, QuestionSchedule,
+    UserScheduleDay, UserAnsweredBitmap, ExportJob, UserProgressSnapshot,
+    UserSphereDaily, UserAnswerDaily, UserRollupState, CohortWeeklyStat, UserStreak, QuestionStat,
+    QuestionServedDay, CacheInvalidation
 )
+from backend.services.cache import report_cache
+
+# Окно (в днях), за которое снимок прогресса хранит отдельные оценки и ответы
+PROGRESS_SNAPSHOT_DAYS = 30
 
 
 # User CRUD
@@ -88,10 +99,27 @@ async def update_user_profile(
 
 
 # UserSphere CRUD
-async def create_user_sphere(db: AsyncSession, user_id: int, sphere: str, rating: int) -> UserSphere:
+async def add_user_sphere(db: AsyncSession, user_id: int, sphere: str, rating: int) -> UserSphere:
+    """Добавляет оценку сферы и обновляет снимок прогресса без коммита (для группового коммита)"""
     user_sphere = UserSphere(user_id=user_id, sphere=sphere, rating=rating)
     db.add(user_sphere)
+    await db.flush()
+    
+    # Обновляем снимок прогресса (если он уже построен)
+    snapshot = await _get_progress_snapshot_row(db, user_id)
+    if snapshot:
+        state = _load_snapshot_state(snapshot)
+        _add_snapshot_rating(state, user_sphere.date, user_sphere.id, sphere, rating)
+        _prune_snapshot_state(state, datetime.utcnow())
+        _save_snapshot_state(snapshot, state)
+    return user_sphere
+
+
+async def create_user_sphere(db: AsyncSession, user_id: int, sphere: str, rating: int) -> UserSphere:
+    user_sphere = await add_user_sphere(db, user_id, sphere, rating)
+    report_cache.stage_invalidation(db, [user_id])
     await db.commit()
+    await report_cache.invalidate(user_id, publish=False)
     await db.refresh(user_sphere)
     return user_sphere
 
@@ -104,6 +132,18 @@ async def get_user_spheres(db: AsyncSession, user_id: int, date: Optional[dateti
     return list(result.scalars().all())
 
 
+async def stream_user_spheres(db: AsyncSession, user_id: int, batch_size: int = 500) -> AsyncIterator[dict]:
+    """Построчно отдает оценки сфер пользователя (от новых к старым) через серверный курсор"""
+    result = await db.stream(
+        select(UserSphere.sphere, UserSphere.rating, UserSphere.date)
+        .where(UserSphere.user_id == user_id)
+        .order_by(UserSphere.date.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    async for row in result:
+        yield dict(row._mapping)
+
+
 async def get_latest_user_spheres(db: AsyncSession, user_id: int) -> List[UserSphere]:
     # Получаем последние оценки по каждой сфере
     # Получаем все оценки пользователя, отсортированные по дате
@@ -140,56 +180,73 @@ async def get_questions_by_sphere(db: AsyncSession, sphere: str, active_only: bo
     return list(result.scalars().all())
 
 
-async def get_random_question_by_sphere(
-    db: AsyncSession, 
-    sphere: str, 
-    user_id: int, 
+async def get_random_unanswered_question(
+    db: AsyncSession,
+    user_id: int,
     since_date: Optional[datetime] = None
 ) -> Optional[Question]:
     """
-    Получает случайный вопрос по сфере, на который пользователь еще не отвечал.
+    Получает случайный активный вопрос из любой сферы каталога (таблица spheres),
+    на который пользователь еще не отвечал за период. Выполняется одним запросом.
     
     Args:
         db: Сессия базы данных
-        sphere: Ключ сферы
         user_id: ID пользователя
         since_date: Дата начала периода для проверки ответов. Если не указана, проверяются ответы за сегодня.
     """
-    # Определяем дату начала периода для проверки ответов
     if since_date is None:
         # По умолчанию проверяем ответы за сегодня
-        check_date = datetime.combine(datetime.utcnow().date(), datetime.min.time())
-    else:
-        check_date = since_date
+        since_date = datetime.combine(datetime.utcnow().date(), datetime.min.time())
     
-    # Получаем вопросы, на которые пользователь уже отвечал за период
-    answered_questions_result = await db.execute(
+    answered_question_ids = (
         select(Answer.question_id)
-        .where(and_(
-            Answer.user_id == user_id,
-            Answer.date >= check_date
-        ))
+        .where(
+            and_(
+                Answer.user_id == user_id,
+                Answer.date >= since_date
+            )
+        )
     )
-    answered_question_ids = [row[0] for row in answered_questions_result.all()]
-    
-    # Пробуем найти вопрос, на который еще не отвечали за период
-    query = select(Question).where(
-        and_(
-            Question.sphere == sphere,
-            Question.is_active == True,
-            ~Question.id.in_(answered_question_ids) if answered_question_ids else True
+    result = await db.execute(
+        select(Question)
+        .join(Sphere, Sphere.key == Question.sphere)
+        .where(
+            and_(
+                Question.is_active == True,
+                Question.id.not_in(answered_question_ids)
+            )
         )
+        .order_by(func.random())
+        .limit(1)
     )
-    result = await db.execute(query)
-    questions = list(result.scalars().all())
-    
-    # Если есть неотвеченные вопросы, возвращаем случайный
-    if questions:
-        import random
-        return random.choice(questions)
-    
-    # Если все вопросы отвечены за период, возвращаем None (все вопросы уже отвечены)
-    return None
+    return result.scalar_one_or_none()
+
+
+async def get_active_question_rows(db: AsyncSession) -> List[tuple]:
+    """
+    Получает все активные вопросы в виде (id, sphere, text, type).
+    Используется для загрузки банка вопросов в память.
+    """
+    result = await db.execute(
+        select(Question.id, Question.sphere, Question.text, Question.type)
+        .where(Question.is_active == True)
+        .order_by(Question.sphere, Question.id)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def get_answered_question_ids(db: AsyncSession, user_id: int, since_date: datetime) -> set:
+    """Возвращает ID вопросов, на которые пользователь ответил начиная с since_date"""
+    result = await db.execute(
+        select(Answer.question_id)
+        .where(
+            and_(
+                Answer.user_id == user_id,
+                Answer.date >= since_date
+            )
+        )
+    )
+    return {row[0] for row in result.all()}
 
 
 async def get_all_questions(db: AsyncSession, active_only: bool = False) -> List[Question]:
@@ -201,6 +258,108 @@ async def get_all_questions(db: AsyncSession, active_only: bool = False) -> List
     return list(result.scalars().all())
 
 
+async def get_questions_page(
+    db: AsyncSession,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[str, int]] = None,
+    sphere: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    text_query: Optional[str] = None
+) -> List[Question]:
+    """
+    Страница вопросов (для админов) в порядке (sphere, id) с keyset-пагинацией.
+    
+    Args:
+        limit: Размер страницы (None - без ограничения)
+        after: Курсор (sphere, id) последнего вопроса предыдущей страницы
+        sphere, is_active: Фильтры по сфере и активности
+        text_query: Подстрока текста вопроса (без учета регистра для латиницы)
+    """
+    query = select(Question)
+    if sphere is not None:
+        query = query.where(Question.sphere == sphere)
+    if is_active is not None:
+        query = query.where(Question.is_active == is_active)
+    if text_query:
+        query = query.where(Question.text.contains(text_query, autoescape=True))
+    if after:
+        after_sphere, after_id = after
+        query = query.where(
+            or_(
+                Question.sphere > after_sphere,
+                and_(Question.sphere == after_sphere, Question.id > after_id)
+            )
+        )
+    query = query.order_by(Question.sphere, Question.id)
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+# Размер пачки при поиске существующих вопросов массового импорта (ограничение числа параметров SQLite)
+QUESTIONS_LOOKUP_BATCH = 500
+
+
+async def upsert_questions(db: AsyncSession, items: List[dict]) -> Dict[str, int]:
+    """
+    Массовый импорт вопросов одной транзакцией. Элемент с id обновляет этот вопрос,
+    элемент без id обновляет вопрос с тем же (sphere, text) или создает новый.
+    Вставки и обновления выполняются пакетными INSERT/UPDATE, сфера в расписании
+    синхронизируется со сферой вопроса. Повторы одного (sphere, text) без id создают
+    один вопрос (берется последний). Возвращает количество созданных, обновленных и неизмененных вопросов.
+    Если вопроса с указанным id нет, вызывает ValueError (транзакция не начинает изменений).
+    """
+    fields = ("sphere", "text", "type", "is_active")
+    ids = [item["id"] for item in items if item.get("id") is not None]
+    texts = list({item["text"] for item in items if item.get("id") is None})
+    
+    by_id = {}
+    for start in range(0, len(ids), QUESTIONS_LOOKUP_BATCH):
+        result = await db.execute(select(Question).where(Question.id.in_(ids[start:start + QUESTIONS_LOOKUP_BATCH])))
+        by_id.update({question.id: question for question in result.scalars()})
+    missing = sorted(set(ids) - set(by_id))
+    if missing:
+        raise ValueError(f"Questions not found: {missing[:20]}")
+    
+    by_key = {}
+    for start in range(0, len(texts), QUESTIONS_LOOKUP_BATCH):
+        result = await db.execute(select(Question).where(Question.text.in_(texts[start:start + QUESTIONS_LOOKUP_BATCH])))
+        for question in result.scalars():
+            by_key.setdefault((question.sphere, question.text), question)
+    
+    inserts, updates, moved = {}, {}, {}
+    unchanged = 0
+    for item in items:
+        existing = by_id.get(item.get("id")) if item.get("id") is not None else by_key.get((item["sphere"], item["text"]))
+        if existing is None:
+            inserts[(item["sphere"], item["text"])] = {field: item[field] for field in fields}
+            continue
+        values = {field: item[field] for field in fields if getattr(existing, field) != item[field]}
+        if not values:
+            unchanged += 1
+            continue
+        if "sphere" in values:
+            moved[existing.id] = values["sphere"]
+        updates.setdefault(existing.id, {"id": existing.id}).update(values)
+    
+    # Пакетные INSERT и UPDATE по первичному ключу (executemany), без создания объектов в сессии
+    if inserts:
+        await db.execute(insert(Question), list(inserts.values()))
+    if updates:
+        await db.execute(update(Question), list(updates.values()))
+    if moved:
+        schedule = QuestionSchedule.__table__
+        await db.execute(
+            update(schedule)
+            .where(schedule.c.question_id == bindparam("moved_question_id"))
+            .values(sphere=bindparam("moved_sphere")),
+            [{"moved_question_id": question_id, "moved_sphere": sphere} for question_id, sphere in moved.items()]
+        )
+    await db.commit()
+    return {"created": len(inserts), "updated": len(updates), "unchanged": unchanged}
+
+
 async def create_question(
     db: AsyncSession,
     sphere: str,
@@ -234,8 +393,14 @@ async def update_question(
     if not question:
         return None
     
-    if sphere is not None:
+    if sphere is not None and sphere != question.sphere:
         question.sphere = sphere
+        # Сфера в расписании должна совпадать со сферой вопроса
+        await db.execute(
+            update(QuestionSchedule)
+            .where(QuestionSchedule.question_id == question_id)
+            .values(sphere=sphere)
+        )
     if text is not None:
         question.text = text
     if type is not None:
@@ -254,27 +419,203 @@ async def delete_question(db: AsyncSession, question_id: int) -> bool:
     if not question:
         return False
     
-    await db.delete(question)
+    # Пользователи, чьи ответы удаляются вместе с вопросом
+    result = await db.execute(select(Answer.user_id).where(Answer.question_id == question_id).distinct())
+    user_ids = list(result.scalars().all())
+    
+    # Удаляем ответы на вопрос, вопрос из расписания и сам вопрос
+    await db.execute(delete(Answer).where(Answer.question_id == question_id))
+    await db.execute(delete(QuestionSchedule).where(QuestionSchedule.question_id == question_id))
+    await db.execute(delete(Question).where(Question.id == question_id))
+    await clear_answered_bits(db, user_ids, [question_id])
+    await reset_users_history(db, user_ids)
     await db.commit()
+    await report_cache.invalidate_many(user_ids)
     return True
 
 
 # Answer CRUD
-async def create_answer(db: AsyncSession, user_id: int, question_id: int, answer: str) -> Answer:
-    answer_obj = Answer(user_id=user_id, question_id=question_id, answer=answer)
+async def add_answer(
+    db: AsyncSession,
+    user_id: int,
+    question_id: int,
+    answer: str,
+    idempotency_key: Optional[str] = None
+) -> Answer:
+    """
+    Добавляет ответ и обновляет битовую карту, серию и снимок прогресса без коммита (для группового коммита).
+    Повтор idempotency_key пользователя вызывает IntegrityError (транзакцию откатывает вызывающий код).
+    """
+    answer_obj = Answer(user_id=user_id, question_id=question_id, answer=answer, idempotency_key=idempotency_key)
     db.add(answer_obj)
+    
+    # Отмечаем вопрос в битовой карте отвеченных вопросов (если она уже построена)
+    result = await db.execute(select(UserAnsweredBitmap).where(UserAnsweredBitmap.user_id == user_id))
+    bitmap = result.scalar_one_or_none()
+    if bitmap:
+        bitmap.bits = _bitmap_to_bytes(_bitmap_from_bytes(bitmap.bits) | (1 << question_id))
+    
+    await db.flush()
+    await update_user_streak(db, user_id, answer_obj.date)
+    
+    # Обновляем снимок прогресса (если он уже построен)
+    snapshot = await _get_progress_snapshot_row(db, user_id)
+    if snapshot:
+        state = _load_snapshot_state(snapshot)
+        state["recent_answers"].append(answer_obj.date.isoformat())
+        _prune_snapshot_state(state, datetime.utcnow())
+        _save_snapshot_state(snapshot, state)
+    return answer_obj
+
+
+async def create_answer(
+    db: AsyncSession,
+    user_id: int,
+    question_id: int,
+    answer: str,
+    idempotency_key: Optional[str] = None
+) -> Answer:
+    answer_obj = await add_answer(db, user_id, question_id, answer, idempotency_key)
+    report_cache.stage_invalidation(db, [user_id])
     await db.commit()
+    await report_cache.invalidate(user_id, publish=False)
     await db.refresh(answer_obj)
     return answer_obj
 
 
-async def get_user_answers(db: AsyncSession, user_id: int, days: Optional[int] = None) -> List[Answer]:
-    query = select(Answer).where(Answer.user_id == user_id)
+async def get_answer_by_idempotency_key(db: AsyncSession, user_id: int, idempotency_key: str) -> Optional[Answer]:
+    """Ответ, уже созданный запросом с этим ключом идемпотентности (по уникальному индексу ux_answers_user_idempotency)"""
+    result = await db.execute(
+        select(Answer).where(and_(Answer.user_id == user_id, Answer.idempotency_key == idempotency_key))
+    )
+    return result.scalar_one_or_none()
+
+
+def _user_answers_query(user_id: int, columns: List[str], days: Optional[int] = None):
+    query = (
+        select(*[getattr(Answer, column) for column in columns])
+        .where(Answer.user_id == user_id)
+    )
     if days:
         start_date = datetime.utcnow() - timedelta(days=days)
         query = query.where(Answer.date >= start_date)
-    result = await db.execute(query.order_by(Answer.date.desc()))
-    return list(result.scalars().all())
+    return query.order_by(Answer.date.desc(), Answer.id.desc())
+
+
+async def get_user_answers_page(
+    db: AsyncSession,
+    user_id: int,
+    columns: List[str],
+    limit: Optional[int],
+    before: Optional[Tuple[datetime, int]] = None,
+    days: Optional[int] = None
+) -> List[dict]:
+    """
+    Получает страницу ответов пользователя (от новых к старым) с keyset-пагинацией по (date, id).
+    
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+        columns: Список колонок Answer, которые нужно выбрать (например, без полного текста ответа)
+        limit: Размер страницы (None - все ответы)
+        before: Курсор (date, id) последнего ответа предыдущей страницы
+        days: Если указано, только ответы за последние days дней
+    """
+    query = _user_answers_query(user_id, columns, days)
+    if before:
+        before_date, before_id = before
+        query = query.where(
+            or_(
+                Answer.date < before_date,
+                and_(Answer.date == before_date, Answer.id < before_id)
+            )
+        )
+    result = await db.execute(query.limit(limit))
+    return [dict(row._mapping) for row in result.all()]
+
+
+async def stream_user_answers(
+    db: AsyncSession,
+    user_id: int,
+    columns: List[str],
+    days: Optional[int] = None,
+    batch_size: int = 500
+) -> AsyncIterator[dict]:
+    """Построчно отдает ответы пользователя (от новых к старым) через серверный курсор"""
+    result = await db.stream(
+        _user_answers_query(user_id, columns, days).execution_options(yield_per=batch_size)
+    )
+    async for row in result:
+        yield dict(row._mapping)
+
+
+# Разметка найденных слов во фрагментах результатов поиска
+SEARCH_HIGHLIGHT = ("<mark>", "</mark>")
+# Временные маркеры найденных слов из snippet (символы из области частного использования Unicode):
+# текст фрагмента экранируется, и только после этого маркеры заменяются на SEARCH_HIGHLIGHT
+SNIPPET_MARKERS = ("\ue000", "\ue001")
+
+
+def _fts_match_query(query: str) -> Optional[str]:
+    """Строит запрос FTS5 из пользовательского текста: все слова обязательны, последнее ищется по префиксу"""
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight_snippet(snippet: str) -> str:
+    """Экранирует HTML во фрагменте ответа и размечает найденные слова тегами SEARCH_HIGHLIGHT"""
+    escaped = html.escape(snippet, quote=False)
+    return escaped.replace(SNIPPET_MARKERS[0], SEARCH_HIGHLIGHT[0]).replace(SNIPPET_MARKERS[1], SEARCH_HIGHLIGHT[1])
+
+
+async def search_user_answers(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    limit: int,
+    after: Optional[Tuple[float, int]] = None
+) -> List[dict]:
+    """
+    Полнотекстовый поиск по ответам пользователя через индекс FTS5 answers_fts (см. migrate_answers_fts.py).
+    Сначала выбираются ответы пользователя по индексу ix_answers_user_date, и для каждого проверяется
+    совпадение в индексе по rowid (CROSS JOIN задает порядок), поэтому ответы других пользователей не просматриваются.
+    Результаты упорядочены по релевантности (bm25) и id, after - курсор (rank, id) последнего результата
+    предыдущей страницы. Для каждого результата возвращается фрагмент с HTML-экранированным текстом
+    и найденными словами в SEARCH_HIGHLIGHT.
+    """
+    match = _fts_match_query(query)
+    if match is None:
+        return []
+    
+    after_rank, after_id = after if after else (None, None)
+    statement = text(
+        "SELECT answers.id, answers.question_id, answers.date, "
+        "snippet(answers_fts, 0, :mark_start, :mark_end, '…', 16) AS snippet, "
+        "bm25(answers_fts) AS rank "
+        "FROM answers CROSS JOIN answers_fts ON answers_fts.rowid = answers.id "
+        "WHERE answers.user_id = :user_id AND answers_fts MATCH :match "
+        "AND (:after_rank IS NULL OR bm25(answers_fts) > :after_rank "
+        "OR (bm25(answers_fts) = :after_rank AND answers.id < :after_id)) "
+        "ORDER BY rank, answers.id DESC "
+        "LIMIT :limit"
+    ).columns(date=DateTime)
+    result = await db.execute(statement, {
+        "mark_start": SNIPPET_MARKERS[0],
+        "mark_end": SNIPPET_MARKERS[1],
+        "match": match,
+        "user_id": user_id,
+        "after_rank": after_rank,
+        "after_id": after_id,
+        "limit": limit
+    })
+    rows = [dict(row._mapping) for row in result.all()]
+    for row in rows:
+        row["snippet"] = _highlight_snippet(row["snippet"])
+    return rows
 
 
 async def has_user_answered_today(db: AsyncSession, user_id: int) -> bool:
@@ -293,6 +634,379 @@ async def has_user_answered_today(db: AsyncSession, user_id: int) -> bool:
     return result.scalar_one_or_none() is not None
 
 
+# Answered questions bitmap
+def _bitmap_from_bytes(data: Optional[bytes]) -> int:
+    return int.from_bytes(data or b"", "little")
+
+
+def _bitmap_to_bytes(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+async def get_answered_bitmap(db: AsyncSession, user_id: int) -> int:
+    """
+    Возвращает битовую карту вопросов, на которые пользователь ответил с момента выбора фокус-сфер.
+    Бит с номером question_id установлен, если на вопрос есть ответ.
+    Если карта еще не построена, строит её одним запросом по ответам и сохраняет
+    (INSERT ... ON CONFLICT DO NOTHING: при параллельном построении сохраняется одна карта, и обе стороны читают её).
+    """
+    query = select(UserAnsweredBitmap.bits).where(UserAnsweredBitmap.user_id == user_id)
+    bits = (await db.execute(query)).scalar_one_or_none()
+    if bits is not None:
+        return _bitmap_from_bytes(bits)
+    
+    focus_spheres = await get_user_focus_spheres(db, user_id)
+    if not focus_spheres:
+        return 0
+    
+    since = min(fs.selected_at for fs in focus_spheres)
+    bits = 0
+    for question_id in await get_answered_question_ids(db, user_id, since):
+        bits |= 1 << question_id
+    
+    await db.execute(
+        sqlite_insert(UserAnsweredBitmap)
+        .values(user_id=user_id, since=since, bits=_bitmap_to_bytes(bits))
+        .on_conflict_do_nothing(index_elements=[UserAnsweredBitmap.user_id])
+    )
+    await db.commit()
+    return _bitmap_from_bytes((await db.execute(query)).scalar_one())
+
+
+async def clear_answered_bits(db: AsyncSession, user_ids: List[int], question_ids: List[int]):
+    """
+    Снимает биты удаленных вопросов в битовых картах пользователей (без коммита),
+    иначе новый вопрос с тем же id (SQLite может переиспользовать id) считался бы уже отвеченным.
+    """
+    mask = 0
+    for question_id in question_ids:
+        mask |= 1 << question_id
+    if not mask:
+        return
+    for start in range(0, len(user_ids), HISTORY_RESET_BATCH_USERS):
+        result = await db.execute(
+            select(UserAnsweredBitmap)
+            .where(UserAnsweredBitmap.user_id.in_(user_ids[start:start + HISTORY_RESET_BATCH_USERS]))
+        )
+        for bitmap in result.scalars().all():
+            bits = _bitmap_from_bytes(bitmap.bits)
+            if bits & mask:
+                bitmap.bits = _bitmap_to_bytes(bits & ~mask)
+
+
+# UserProgressSnapshot CRUD
+async def _get_progress_snapshot_row(db: AsyncSession, user_id: int) -> Optional[UserProgressSnapshot]:
+    result = await db.execute(select(UserProgressSnapshot).where(UserProgressSnapshot.user_id == user_id))
+    return result.scalar_one_or_none()
+
+
+def _load_snapshot_state(snapshot: UserProgressSnapshot) -> dict:
+    return {
+        "latest_ratings": json.loads(snapshot.latest_ratings or "{}"),
+        "recent_ratings": json.loads(snapshot.recent_ratings or "[]"),
+        "baseline_ratings": json.loads(snapshot.baseline_ratings or "{}"),
+        "recent_answers": json.loads(snapshot.recent_answers or "[]")
+    }
+
+
+def _save_snapshot_state(snapshot: UserProgressSnapshot, state: dict):
+    snapshot.latest_ratings = json.dumps(state["latest_ratings"])
+    snapshot.recent_ratings = json.dumps(state["recent_ratings"])
+    snapshot.baseline_ratings = json.dumps(state["baseline_ratings"])
+    snapshot.recent_answers = json.dumps(state["recent_answers"])
+
+
+def _add_snapshot_rating(state: dict, date: datetime, rating_id: int, sphere: str, rating: int):
+    """Добавляет оценку сферы в снимок (последняя оценка сферы определяется по (date, id))"""
+    entry = [date.isoformat(), rating_id, rating]
+    latest = state["latest_ratings"].get(sphere)
+    if latest is None or (latest[0], latest[1]) <= (entry[0], entry[1]):
+        state["latest_ratings"][sphere] = entry
+    state["recent_ratings"].append([entry[0], rating_id, sphere, rating])
+    state["recent_ratings"].sort(key=lambda item: (item[0], item[1]))
+
+
+def _prune_snapshot_state(state: dict, now: datetime):
+    """
+    Убирает из снимка оценки и ответы старше PROGRESS_SNAPSHOT_DAYS дней.
+    Вышедшие из окна оценки становятся базовыми (последняя оценка сферы до начала окна).
+    """
+    cutoff = (now - timedelta(days=PROGRESS_SNAPSHOT_DAYS)).isoformat()
+    recent_ratings = state["recent_ratings"]
+    pruned = 0
+    while pruned < len(recent_ratings) and recent_ratings[pruned][0] < cutoff:
+        date, rating_id, sphere, rating = recent_ratings[pruned]
+        state["baseline_ratings"][sphere] = [date, rating_id, rating]
+        pruned += 1
+    if pruned:
+        del recent_ratings[:pruned]
+    
+    recent_answers = state["recent_answers"]
+    pruned = 0
+    while pruned < len(recent_answers) and recent_answers[pruned] < cutoff:
+        pruned += 1
+    if pruned:
+        del recent_answers[:pruned]
+
+
+async def get_progress_snapshot(db: AsyncSession, user_id: int) -> dict:
+    """
+    Возвращает снимок прогресса пользователя, актуальный на текущий момент.
+    Если снимок еще не построен, строит его по оценкам сфер и ответам за окно и сохраняет.
+    """
+    now = datetime.utcnow()
+    snapshot = await _get_progress_snapshot_row(db, user_id)
+    if snapshot:
+        state = _load_snapshot_state(snapshot)
+        _prune_snapshot_state(state, now)
+        return state
+    
+    state = {"latest_ratings": {}, "recent_ratings": [], "baseline_ratings": {}, "recent_answers": []}
+    result = await db.execute(
+        select(UserSphere.id, UserSphere.sphere, UserSphere.rating, UserSphere.date)
+        .where(UserSphere.user_id == user_id)
+        .order_by(UserSphere.date, UserSphere.id)
+    )
+    for rating_id, sphere, rating, date in result.all():
+        _add_snapshot_rating(state, date, rating_id, sphere, rating)
+    
+    start_date = now - timedelta(days=PROGRESS_SNAPSHOT_DAYS)
+    result = await db.execute(
+        select(Answer.date)
+        .where(and_(Answer.user_id == user_id, Answer.date >= start_date))
+        .order_by(Answer.date)
+    )
+    state["recent_answers"] = [date.isoformat() for date in result.scalars().all()]
+    _prune_snapshot_state(state, now)
+    
+    snapshot = UserProgressSnapshot(user_id=user_id)
+    _save_snapshot_state(snapshot, state)
+    db.add(snapshot)
+    await db.commit()
+    return state
+
+
+async def reset_progress_snapshots(db: AsyncSession, user_id: Optional[int] = None):
+    """Удаляет снимки прогресса (одного пользователя или всех), они будут построены заново при чтении"""
+    query = delete(UserProgressSnapshot)
+    if user_id is not None:
+        query = query.where(UserProgressSnapshot.user_id == user_id)
+    await db.execute(query)
+
+
+# UserStreak CRUD
+def advance_streak(
+    current: int,
+    longest: int,
+    last_day: Optional[date_type],
+    day: date_type
+) -> Tuple[int, int, date_type]:
+    """Новое состояние серии (current, longest, last_day) после ответа в день day (ответы идут по возрастанию даты)"""
+    if last_day is None or (day - last_day).days > 1:
+        current = 1
+    elif (day - last_day).days == 1:
+        current += 1
+    elif day < last_day:
+        return current, longest, last_day
+    return current, max(longest, current), day
+
+
+async def get_user_streak(db: AsyncSession, user_id: int) -> Optional[UserStreak]:
+    result = await db.execute(select(UserStreak).where(UserStreak.user_id == user_id))
+    return result.scalar_one_or_none()
+
+
+async def update_user_streak(db: AsyncSession, user_id: int, answered_at: datetime):
+    """Учитывает новый ответ в серии пользователя за O(1) (без коммита, вызывается из create_answer)"""
+    streak = await get_user_streak(db, user_id)
+    if streak is None:
+        streak = UserStreak(user_id=user_id, current_streak=0, longest_streak=0, total_answers=0)
+        db.add(streak)
+    streak.current_streak, streak.longest_streak, streak.last_answer_day = advance_streak(
+        streak.current_streak, streak.longest_streak, streak.last_answer_day, answered_at.date()
+    )
+    streak.total_answers += 1
+
+
+async def rebuild_user_streaks(
+    db: AsyncSession,
+    user_id: Optional[int] = None,
+    batch_size: int = 5000,
+    user_ids: Optional[List[int]] = None
+):
+    """
+    Пересчитывает серии (одного пользователя, списка user_ids или всех) одним проходом по ответам,
+    упорядоченным по (user_id, date). Без коммита: вызывается после операций, переписывающих историю ответов.
+    """
+    if user_id is not None:
+        user_ids = [user_id]
+    query = delete(UserStreak)
+    if user_ids is not None:
+        query = query.where(UserStreak.user_id.in_(user_ids))
+    await db.execute(query)
+    
+    answers_query = select(Answer.user_id, Answer.date).order_by(Answer.user_id, Answer.date)
+    if user_ids is not None:
+        answers_query = answers_query.where(Answer.user_id.in_(user_ids))
+    result = await db.stream(answers_query.execution_options(yield_per=batch_size))
+    
+    streaks = []
+    state = None
+    async for answer_user_id, answered_at in result:
+        if state is None or state["user_id"] != answer_user_id:
+            state = {"user_id": answer_user_id, "current_streak": 0, "longest_streak": 0,
+                     "last_answer_day": None, "total_answers": 0}
+            streaks.append(state)
+        state["current_streak"], state["longest_streak"], state["last_answer_day"] = advance_streak(
+            state["current_streak"], state["longest_streak"], state["last_answer_day"], answered_at.date()
+        )
+        state["total_answers"] += 1
+    
+    db.add_all([UserStreak(**row) for row in streaks])
+
+
+# Daily rollups CRUD
+async def get_rollup_watermark(db: AsyncSession, user_id: int) -> Optional[date_type]:
+    """День, начиная с которого оценки и ответы пользователя еще не агрегированы (None - агрегатов нет)"""
+    result = await db.execute(select(UserRollupState.rolled_up_to).where(UserRollupState.user_id == user_id))
+    return result.scalar_one_or_none()
+
+
+async def get_user_ratings_between(
+    db: AsyncSession,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[tuple]:
+    """Оценки сфер пользователя (id, sphere, rating, date) в интервале [start, end) по возрастанию даты"""
+    query = select(UserSphere.id, UserSphere.sphere, UserSphere.rating, UserSphere.date).where(UserSphere.user_id == user_id)
+    if start is not None:
+        query = query.where(UserSphere.date >= start)
+    if end is not None:
+        query = query.where(UserSphere.date < end)
+    result = await db.execute(query.order_by(UserSphere.date, UserSphere.id))
+    return [tuple(row) for row in result.all()]
+
+
+async def get_user_answer_dates_between(
+    db: AsyncSession,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[datetime]:
+    """Даты ответов пользователя в интервале [start, end)"""
+    query = select(Answer.date).where(Answer.user_id == user_id)
+    if start is not None:
+        query = query.where(Answer.date >= start)
+    if end is not None:
+        query = query.where(Answer.date < end)
+    result = await db.execute(query.order_by(Answer.date))
+    return list(result.scalars().all())
+
+
+async def save_daily_rollups(
+    db: AsyncSession,
+    user_id: int,
+    sphere_rows: List[dict],
+    answer_rows: List[dict],
+    rolled_up_to: date_type
+):
+    """Сохраняет дневные агрегаты пользователя и сдвигает границу агрегации в одной транзакции"""
+    db.add_all([UserSphereDaily(user_id=user_id, **row) for row in sphere_rows])
+    db.add_all([UserAnswerDaily(user_id=user_id, **row) for row in answer_rows])
+    
+    result = await db.execute(select(UserRollupState).where(UserRollupState.user_id == user_id))
+    state = result.scalar_one_or_none()
+    if state:
+        state.rolled_up_to = rolled_up_to
+    else:
+        db.add(UserRollupState(user_id=user_id, rolled_up_to=rolled_up_to))
+    await db.commit()
+
+
+async def get_sphere_daily_totals(
+    db: AsyncSession,
+    user_id: int,
+    start_day: date_type,
+    end_day: date_type
+) -> List[tuple]:
+    """Сумма и количество оценок по сферам за дни [start_day, end_day) из дневных агрегатов: (sphere, sum, count, last_rating_at)"""
+    result = await db.execute(
+        select(
+            UserSphereDaily.sphere,
+            func.sum(UserSphereDaily.rating_sum),
+            func.sum(UserSphereDaily.rating_count),
+            func.max(UserSphereDaily.last_rating_at)
+        )
+        .where(and_(
+            UserSphereDaily.user_id == user_id,
+            UserSphereDaily.day >= start_day,
+            UserSphereDaily.day < end_day
+        ))
+        .group_by(UserSphereDaily.sphere)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def get_sphere_daily_rows(
+    db: AsyncSession,
+    user_id: int,
+    start_day: date_type,
+    end_day: date_type
+) -> List[tuple]:
+    """Дневные агрегаты оценок пользователя за дни [start_day, end_day): (day, sphere, rating_sum, rating_count)"""
+    result = await db.execute(
+        select(UserSphereDaily.day, UserSphereDaily.sphere, UserSphereDaily.rating_sum, UserSphereDaily.rating_count)
+        .where(and_(
+            UserSphereDaily.user_id == user_id,
+            UserSphereDaily.day >= start_day,
+            UserSphereDaily.day < end_day
+        ))
+        .order_by(UserSphereDaily.day)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def get_users_pending_rollup(db: AsyncSession, today: date_type, after_user_id: int, limit: int) -> List[int]:
+    """ID пользователей (по возрастанию, начиная после after_user_id), у которых есть неагрегированные завершенные дни"""
+    result = await db.execute(
+        select(User.id)
+        .outerjoin(UserRollupState, UserRollupState.user_id == User.id)
+        .where(and_(
+            User.id > after_user_id,
+            or_(UserRollupState.id.is_(None), UserRollupState.rolled_up_to < today)
+        ))
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def reset_daily_rollups(db: AsyncSession, user_id: Optional[int] = None):
+    """Удаляет дневные агрегаты (одного пользователя или всех), они будут построены заново"""
+    for model in (UserSphereDaily, UserAnswerDaily, UserRollupState):
+        query = delete(model)
+        if user_id is not None:
+            query = query.where(model.user_id == user_id)
+        await db.execute(query)
+
+
+# Количество пользователей в одном запросе пересчета (ограничение числа параметров SQLite)
+HISTORY_RESET_BATCH_USERS = 500
+
+
+async def reset_users_history(db: AsyncSession, user_ids: List[int]):
+    """
+    Сбрасывает снимки прогресса и дневные агрегаты и пересчитывает серии пользователей,
+    у которых удалена часть оценок или ответов (без коммита). Остальных пользователей не затрагивает.
+    """
+    for start in range(0, len(user_ids), HISTORY_RESET_BATCH_USERS):
+        batch = user_ids[start:start + HISTORY_RESET_BATCH_USERS]
+        for model in (UserProgressSnapshot, UserSphereDaily, UserAnswerDaily, UserRollupState):
+            await db.execute(delete(model).where(model.user_id.in_(batch)))
+        await rebuild_user_streaks(db, user_ids=batch)
+
+
 # UserFocusSphere CRUD
 async def set_user_focus_spheres(db: AsyncSession, user_id: int, spheres: List[str]) -> List[UserFocusSphere]:
     # Удаляем старые фокус-сферы
@@ -304,14 +1018,23 @@ async def set_user_focus_spheres(db: AsyncSession, user_id: int, spheres: List[s
     for sphere in old_spheres:
         await db.delete(sphere)
     
+    # Новые фокус-сферы начинают расписание вопросов с первого дня
+    await db.execute(delete(UserScheduleDay).where(UserScheduleDay.user_id == user_id))
+    
+    # Сбрасываем битовую карту отвеченных вопросов: новый период начинается с момента выбора
+    selected_at = datetime.utcnow()
+    await db.execute(delete(UserAnsweredBitmap).where(UserAnsweredBitmap.user_id == user_id))
+    db.add(UserAnsweredBitmap(user_id=user_id, since=selected_at, bits=b""))
+    
     # Создаем новые
     new_spheres = []
     for sphere in spheres:
-        focus_sphere = UserFocusSphere(user_id=user_id, sphere=sphere)
+        focus_sphere = UserFocusSphere(user_id=user_id, sphere=sphere, selected_at=selected_at)
         db.add(focus_sphere)
         new_spheres.append(focus_sphere)
     
     await db.commit()
+    await report_cache.invalidate(user_id)
     for sphere in new_spheres:
         await db.refresh(sphere)
     return new_spheres
@@ -337,40 +1060,22 @@ async def can_change_focus_spheres(db: AsyncSession, user_id: int) -> bool:
     if not focus_spheres:
         return True
     
-    # Определяем дату последнего изменения фокус-сфер (минимальная selected_at)
-    min_selected_at = min(fs.selected_at for fs in focus_spheres)
-    
-    # Для каждой фокус-сферы проверяем, что все активные вопросы отвечены
-    for focus_sphere in focus_spheres:
-        # Получаем все активные вопросы для этой сферы
-        questions = await get_questions_by_sphere(db, focus_sphere.sphere, active_only=True)
-        
-        # Если вопросов нет, пропускаем эту сферу
-        if not questions:
-            continue
-        
-        # Для каждого вопроса проверяем, есть ли ответ после даты изменения фокус-сфер
-        for question in questions:
-            # Проверяем, есть ли ответ на этот вопрос после даты изменения фокус-сфер
-            answer_result = await db.execute(
-                select(Answer)
-                .where(
-                    and_(
-                        Answer.user_id == user_id,
-                        Answer.question_id == question.id,
-                        Answer.date >= min_selected_at
-                    )
-                )
-                .limit(1)
+    # Получаем все активные вопросы по фокус-сферам одним запросом
+    result = await db.execute(
+        select(Question.id).where(
+            and_(
+                Question.sphere.in_([fs.sphere for fs in focus_spheres]),
+                Question.is_active == True
             )
-            answer = answer_result.scalar_one_or_none()
-            
-            # Если на вопрос нет ответа, нельзя менять фокус-сферы
-            if not answer:
-                return False
+        )
+    )
+    required = 0
+    for row in result.all():
+        required |= 1 << row[0]
     
-    # Все вопросы отвечены, можно менять
-    return True
+    # Можно менять, если все биты вопросов фокус-сфер установлены в карте отвеченных вопросов
+    answered = await get_answered_bitmap(db, user_id)
+    return (required & ~answered) == 0
 
 
 async def check_onboarding_completed(db: AsyncSession, user_id: int) -> bool:
@@ -462,27 +1167,193 @@ async def update_subscription(
 
 
 async def delete_user_account(db: AsyncSession, user_id: int) -> bool:
-    """Удалить все данные пользователя из базы данных"""
-    user = await get_user_by_id(db, user_id)
-    if not user:
-        return False
+    """Удалить все данные пользователя из базы данных (несколькими DELETE в одной транзакции)"""
+    deleted = await delete_users_bulk(db, [user_id])
+    return deleted.get(User.__tablename__, 0) > 0
+
+
+# Таблицы с данными пользователя (user_id), очищаемые при пакетном удалении пользователей
+USER_DATA_MODELS = (
+    Answer, UserSphere, UserFocusSphere, Subscription, UserSettings, UserScheduleDay,
+    UserAnsweredBitmap, UserProgressSnapshot, UserSphereDaily, UserAnswerDaily, UserRollupState, UserStreak
+)
+
+
+async def get_inactive_guest_ids(db: AsyncSession, cutoff: datetime, after_user_id: int, limit: int) -> List[int]:
+    """
+    ID гостей (по возрастанию, начиная после after_user_id), созданных до cutoff
+    и без ответов и оценок сфер начиная с cutoff
+    """
+    recent_answers = select(Answer.id).where(and_(Answer.user_id == User.id, Answer.date >= cutoff))
+    recent_ratings = select(UserSphere.id).where(and_(UserSphere.user_id == User.id, UserSphere.date >= cutoff))
+    result = await db.execute(
+        select(User.id)
+        .where(and_(
+            User.id > after_user_id,
+            User.telegram_id < 0,
+            User.created_at < cutoff,
+            ~recent_answers.exists(),
+            ~recent_ratings.exists()
+        ))
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def delete_users_bulk(db: AsyncSession, user_ids: List[int]) -> Dict[str, int]:
+    """
+    Удаляет пользователей и все их данные множественными DELETE ... WHERE user_id IN (...) в одной транзакции
+    (без загрузки объектов и ORM-каскадов). Сохраненные когортные метрики недель, в которые у удаленных
+    пользователей есть дневные агрегаты оценок или ответов, удаляются и будут пересчитаны ночной задачей
+    (users_total остальных недель не пересчитывается - расхождение на число удаленных пользователей допустимо).
+    Возвращает количество удаленных строк по таблицам.
+    """
+    deleted = {}
+    if not user_ids:
+        return deleted
+    
+    result = await db.execute(
+        select(UserSphereDaily.day).where(UserSphereDaily.user_id.in_(user_ids))
+        .union(select(UserAnswerDaily.day).where(UserAnswerDaily.user_id.in_(user_ids)))
+    )
+    active_weeks = {day - timedelta(days=day.weekday()) for day in result.scalars()}
+    
+    for model in USER_DATA_MODELS:
+        result = await db.execute(
+            delete(model).where(model.user_id.in_(user_ids)).execution_options(synchronize_session=False)
+        )
+        deleted[model.__tablename__] = result.rowcount
+    result = await db.execute(
+        delete(User).where(User.id.in_(user_ids)).execution_options(synchronize_session=False)
+    )
+    deleted[User.__tablename__] = result.rowcount
+    if active_weeks:
+        result = await db.execute(
+            delete(CohortWeeklyStat).where(CohortWeeklyStat.week_start.in_(active_weeks))
+        )
+        deleted[CohortWeeklyStat.__tablename__] = result.rowcount
+    await db.commit()
     
-    # Благодаря cascade="all, delete-orphan" в моделях, все связанные данные
-    # (spheres, answers, focus_spheres, settings, subscription) удалятся автоматически
-    await db.delete(user)
+    await report_cache.invalidate_many(user_ids)
+    return deleted
+
+
+# QuestionStat CRUD
+async def add_question_stats(db: AsyncSession, stats: List[dict]):
+    """
+    Прибавляет накопленные счетчики к статистике вопросов INSERT ... ON CONFLICT DO UPDATE
+    (пачками по QUESTIONS_LOOKUP_BATCH вопросов в одной транзакции).
+    stats - [{question_id, times_served, times_answered, last_served_at, last_answered_at}];
+    вопросы, удаленные за время накопления, пропускаются.
+    """
+    for start in range(0, len(stats), QUESTIONS_LOOKUP_BATCH):
+        batch = stats[start:start + QUESTIONS_LOOKUP_BATCH]
+        existing = set((await db.execute(
+            select(Question.id).where(Question.id.in_([row["question_id"] for row in batch]))
+        )).scalars())
+        rows = [row for row in batch if row["question_id"] in existing]
+        if not rows:
+            continue
+        
+        statement = sqlite_insert(QuestionStat).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[QuestionStat.question_id],
+            set_={
+                "times_served": QuestionStat.times_served + statement.excluded.times_served,
+                "times_answered": QuestionStat.times_answered + statement.excluded.times_answered,
+                "last_served_at": func.coalesce(
+                    func.max(QuestionStat.last_served_at, statement.excluded.last_served_at),
+                    QuestionStat.last_served_at,
+                    statement.excluded.last_served_at
+                ),
+                "last_answered_at": func.coalesce(
+                    func.max(QuestionStat.last_answered_at, statement.excluded.last_answered_at),
+                    QuestionStat.last_answered_at,
+                    statement.excluded.last_answered_at
+                )
+            }
+        )
+        await db.execute(statement)
     await db.commit()
-    return True
 
 
-# QuestionSchedule CRUD (заглушки)
-async def get_questions_from_schedule(db: AsyncSession, day_number: int, sphere: Optional[str] = None) -> List[Question]:
+async def add_question_served_days(db: AsyncSession, served: List[tuple]) -> Dict[int, int]:
     """
-    Заглушка: получает вопросы из расписания для указанного дня.
-    Позже будет реализована полная логика работы с расписанием.
+    Записывает показы (day, user_id, question_id) без коммита, уже записанные другими воркерами пропускаются
+    (INSERT ... ON CONFLICT DO NOTHING RETURNING). Возвращает число новых показов по question_id
     """
-    # TODO: Реализовать получение вопросов из таблицы question_schedule
-    # Пока возвращаем пустой список
-    return []
+    counts: Dict[int, int] = {}
+    for start in range(0, len(served), QUESTIONS_LOOKUP_BATCH):
+        batch = served[start:start + QUESTIONS_LOOKUP_BATCH]
+        statement = (
+            sqlite_insert(QuestionServedDay)
+            .values([{"day": day, "user_id": user_id, "question_id": question_id} for day, user_id, question_id in batch])
+            .on_conflict_do_nothing()
+            .returning(QuestionServedDay.question_id)
+        )
+        for question_id in (await db.execute(statement)).scalars():
+            counts[question_id] = counts.get(question_id, 0) + 1
+    return counts
+
+
+async def delete_question_served_days(db: AsyncSession, before: date_type) -> int:
+    """Удаляет показы за дни до before. Возвращает количество удаленных записей"""
+    result = await db.execute(delete(QuestionServedDay).where(QuestionServedDay.day < before))
+    await db.commit()
+    return result.rowcount
+
+
+async def get_question_stats(
+    db: AsyncSession,
+    sphere: Optional[str] = None,
+    order_by: str = "times_served",
+    limit: int = 100,
+    offset: int = 0
+) -> List[dict]:
+    """Вопросы со статистикой использования (вопросы без статистики - с нулями) для админки"""
+    columns = {
+        "times_served": func.coalesce(QuestionStat.times_served, 0),
+        "times_answered": func.coalesce(QuestionStat.times_answered, 0),
+        "last_served_at": QuestionStat.last_served_at,
+        "last_answered_at": QuestionStat.last_answered_at
+    }
+    query = (
+        select(
+            Question.id.label("question_id"), Question.sphere, Question.text, Question.is_active,
+            *[column.label(name) for name, column in columns.items()]
+        )
+        .outerjoin(QuestionStat, QuestionStat.question_id == Question.id)
+    )
+    if sphere is not None:
+        query = query.where(Question.sphere == sphere)
+    sort_column = columns[order_by]
+    query = query.order_by(sort_column.desc().nulls_last(), Question.id).limit(limit).offset(offset)
+    result = await db.execute(query)
+    return [dict(row._mapping) for row in result.all()]
+
+
+# QuestionSchedule CRUD
+async def get_active_schedule_rows(db: AsyncSession) -> List[tuple]:
+    """
+    Получает все записи расписания с активными вопросами в виде (day_number, sphere, question_id).
+    Используется для сборки расписания в памяти.
+    """
+    result = await db.execute(
+        select(QuestionSchedule.day_number, QuestionSchedule.sphere, QuestionSchedule.question_id)
+        .join(Question, QuestionSchedule.question_id == Question.id)
+        .where(Question.is_active == True)
+        .order_by(QuestionSchedule.day_number, QuestionSchedule.id)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def get_all_schedule_entries(db: AsyncSession) -> List[QuestionSchedule]:
+    """Получить все записи расписания (для админов)"""
+    result = await db.execute(
+        select(QuestionSchedule).order_by(QuestionSchedule.day_number, QuestionSchedule.sphere, QuestionSchedule.id)
+    )
+    return list(result.scalars().all())
 
 
 async def create_question_schedule_entry(
@@ -490,14 +1361,46 @@ async def create_question_schedule_entry(
     day_number: int,
     question_id: int,
     sphere: str
-):
+) -> QuestionSchedule:
+    """Создает запись в расписании вопросов"""
+    entry = QuestionSchedule(day_number=day_number, question_id=question_id, sphere=sphere)
+    db.add(entry)
+    await db.commit()
+    await db.refresh(entry)
+    return entry
+
+
+async def delete_question_schedule_entry(db: AsyncSession, entry_id: int) -> bool:
+    """Удалить запись из расписания вопросов"""
+    result = await db.execute(delete(QuestionSchedule).where(QuestionSchedule.id == entry_id))
+    await db.commit()
+    return result.rowcount > 0
+
+
+async def get_user_schedule_day(db: AsyncSession, user_id: int) -> int:
     """
-    Заглушка: создает запись в расписании вопросов.
-    Позже будет использоваться для заполнения расписания.
+    Возвращает текущий день расписания для пользователя.
+    Счетчик создается со значением 1 при первом обращении и увеличивается на 1,
+    если с момента последнего изменения наступил новый день. Дни без активности не пропускаются.
     """
-    # TODO: Реализовать создание записи в таблице question_schedule
-    # Пока просто pass
-    pass
+    result = await db.execute(select(UserScheduleDay).where(UserScheduleDay.user_id == user_id))
+    schedule_day = result.scalar_one_or_none()
+    now = datetime.utcnow()
+    
+    if not schedule_day:
+        schedule_day = UserScheduleDay(user_id=user_id, day_number=1, last_advanced_at=now)
+        db.add(schedule_day)
+        await db.commit()
+        return 1
+    
+    if schedule_day.last_advanced_at.date() < now.date():
+        schedule_day.day_number += 1
+        schedule_day.last_advanced_at = now
+        await db.commit()
+    
+    return schedule_day.day_number
+
+
 
 
 # Sphere CRUD
@@ -551,61 +1454,85 @@ async def delete_sphere(db: AsyncSession, sphere_id: int) -> bool:
         return False
     
     sphere_key = sphere.key
+    sphere_questions = select(Question.id).where(Question.sphere == sphere_key)
     
-    # Удаляем все оценки сфер пользователей
-    await db.execute(
-        delete(UserSphere).where(UserSphere.sphere == sphere_key)
-    )
-    
-    # Удаляем все фокус-сферы пользователей
-    await db.execute(
-        delete(UserFocusSphere).where(UserFocusSphere.sphere == sphere_key)
+    # Пользователи, чьи оценки сферы или ответы на ее вопросы удаляются
+    result = await db.execute(
+        select(UserSphere.user_id).where(UserSphere.sphere == sphere_key)
+        .union(select(Answer.user_id).where(Answer.question_id.in_(sphere_questions)))
     )
-    
-    # Удаляем все записи из расписания вопросов
+    user_ids = list(result.scalars().all())
+    question_ids = list((await db.execute(sphere_questions)).scalars().all())
+    
+    # Удаляем множественными DELETE: оценки и фокус-сферы пользователей, ответы на вопросы сферы,
+    # записи расписания и вопросы (без загрузки строк в сессию)
+    await db.execute(delete(UserSphere).where(UserSphere.sphere == sphere_key))
+    await db.execute(delete(UserFocusSphere).where(UserFocusSphere.sphere == sphere_key))
+    await db.execute(delete(Answer).where(Answer.question_id.in_(sphere_questions)))
     await db.execute(
-        delete(QuestionSchedule).where(QuestionSchedule.sphere == sphere_key)
-    )
-    
-    # Получаем все вопросы этой сферы для удаления (ответы удалятся автоматически благодаря каскаду)
-    questions_result = await db.execute(
-        select(Question).where(Question.sphere == sphere_key)
+        delete(QuestionSchedule).where(or_(
+            QuestionSchedule.sphere == sphere_key,
+            QuestionSchedule.question_id.in_(sphere_questions)
+        ))
     )
-    questions = questions_result.scalars().all()
-    for question in questions:
-        await db.delete(question)
+    await db.execute(delete(Question).where(Question.sphere == sphere_key))
     
     # Удаляем саму сферу
-    await db.delete(sphere)
+    await db.execute(delete(Sphere).where(Sphere.id == sphere_id))
+    await clear_answered_bits(db, user_ids, question_ids)
+    await reset_users_history(db, user_ids)
     await db.commit()
+    await report_cache.invalidate_many(user_ids)
     return True
 
 
-async def create_guest_user_with_test_data(db: AsyncSession, ip_address: str) -> User:
+async def create_guest_user(db: AsyncSession, ip_address: str) -> User:
     """
-    Создает гостевого пользователя с тестовыми данными:
-    - Оценки всех сфер жизни (случайные от 5 до 8)
-    - Выбор 1-2 фокус-сфер (случайно)
-    - Несколько тестовых ответов на вопросы (5-10 ответов за последние 3-7 дней)
-    - Настройки пользователя
+    Создает гостевого пользователя одной вставкой в users.
+    Настройки и подписка создаются при первом обращении к ним, а демо-данные -
+    при первом запросе гостя с X-Guest-User-Id (см. materialize_guest_demo_data).
     """
     # Генерируем случайный отрицательный telegram_id для гостя
     guest_telegram_id = -random.randint(1000000, 9999999)
     
-    # Создаем пользователя с IP адресом
-    user = await create_user(
-        db,
+    user = User(
         telegram_id=guest_telegram_id,
         username=f"guest_{guest_telegram_id}",
         first_name="Гость",
-        last_name=None,
-        ip_address=ip_address
+        ip_address=ip_address,
+        demo_data_pending=True
+    )
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+
+async def materialize_guest_demo_data(db: AsyncSession, user: User) -> bool:
+    """
+    Создает демо-данные гостя, если они еще не созданы:
+    - Оценки всех сфер жизни (случайные от 5 до 8)
+    - Выбор 1-2 фокус-сфер (случайно)
+    - Несколько тестовых ответов на вопросы (5-10 ответов за последние 3-7 дней)
+    Флаг demo_data_pending снимается атомарно, поэтому параллельные запросы не создают данные дважды.
+    Возвращает True, если данные созданы этим вызовом.
+    """
+    result = await db.execute(
+        update(User)
+        .where(User.id == user.id, User.demo_data_pending == True)
+        .values(demo_data_pending=False)
     )
+    if result.rowcount == 0:
+        await db.commit()
+        await db.refresh(user)
+        return False
     
     # Получаем все сферы жизни
     all_spheres = await get_all_spheres(db)
     if not all_spheres:
-        return user
+        await db.commit()
+        await db.refresh(user)
+        return True
     
     sphere_keys = [sphere.key for sphere in all_spheres]
     
@@ -712,9 +1639,15 @@ async def create_guest_user_with_test_data(db: AsyncSession, ip_address: str) ->
             db.add(answer)
             answers_created += 1
     
+    await db.flush()
+    # Демо-данные задним числом: агрегаты и снимок прогресса, построенные до них, устарели
+    await reset_progress_snapshots(db, user.id)
+    await reset_daily_rollups(db, user.id)
+    await rebuild_user_streaks(db, user.id)
     await db.commit()
+    await report_cache.invalidate(user.id)
     await db.refresh(user)
-    return user
+    return True
 
 
 async def generate_test_data_for_user(db: AsyncSession, user_id: int) -> bool:
@@ -730,6 +1663,7 @@ async def generate_test_data_for_user(db: AsyncSession, user_id: int) -> bool:
     user = await get_user_by_id(db, user_id)
     if not user:
         return False
+    user.demo_data_pending = False
     
     # Получаем все сферы жизни
     all_spheres = await get_all_spheres(db)
@@ -742,6 +1676,10 @@ async def generate_test_data_for_user(db: AsyncSession, user_id: int) -> bool:
     await db.execute(delete(UserSphere).where(UserSphere.user_id == user_id))
     await db.execute(delete(UserFocusSphere).where(UserFocusSphere.user_id == user_id))
     await db.execute(delete(Answer).where(Answer.user_id == user_id))
+    await db.execute(delete(UserScheduleDay).where(UserScheduleDay.user_id == user_id))
+    await db.execute(delete(UserAnsweredBitmap).where(UserAnsweredBitmap.user_id == user_id))
+    await reset_progress_snapshots(db, user_id)
+    await reset_daily_rollups(db, user_id)
     
     today = datetime.utcnow()
     
@@ -846,6 +1784,176 @@ async def generate_test_data_for_user(db: AsyncSession, user_id: int) -> bool:
             db.add(answer)
             answers_created += 1
     
+    await db.flush()
+    await rebuild_user_streaks(db, user_id)
     await db.commit()
+    await report_cache.invalidate(user_id)
     return True
 
+
+# ExportJob CRUD
+async def create_export_job(db: AsyncSession, output_dir: str, created_by: Optional[int] = None) -> ExportJob:
+    """Создать задачу массового экспорта"""
+    job = ExportJob(output_dir=output_dir, created_by=created_by)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def get_export_job(db: AsyncSession, job_id: int) -> Optional[ExportJob]:
+    result = await db.execute(select(ExportJob).where(ExportJob.id == job_id))
+    return result.scalar_one_or_none()
+
+
+async def claim_export_job(db: AsyncSession, job_id: int, owner: str, stale_before: datetime) -> bool:
+    """
+    Захватывает задачу экспорта для выполнения воркером owner одним UPDATE: задача не завершена
+    и не выполняется другим воркером (или его heartbeat_at старше stale_before). Возвращает True при успехе
+    """
+    result = await db.execute(
+        update(ExportJob)
+        .where(
+            ExportJob.id == job_id,
+            ExportJob.status != "completed",
+            or_(ExportJob.claimed_by.is_(None), ExportJob.heartbeat_at < stale_before)
+        )
+        .values(claimed_by=owner, heartbeat_at=datetime.utcnow(), status="running", error=None)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def release_export_job(db: AsyncSession, job_id: int, owner: str):
+    """Снимает захват задачи экспорта, если она все еще принадлежит воркеру owner"""
+    await db.execute(
+        update(ExportJob)
+        .where(ExportJob.id == job_id, ExportJob.claimed_by == owner)
+        .values(claimed_by=None)
+    )
+    await db.commit()
+
+
+async def get_export_jobs(db: AsyncSession, limit: int = 20) -> List[ExportJob]:
+    """Получить последние задачи массового экспорта"""
+    result = await db.execute(select(ExportJob).order_by(ExportJob.id.desc()).limit(limit))
+    return list(result.scalars().all())
+
+
+async def get_user_rows_after(db: AsyncSession, after_user_id: int, limit: int) -> List[dict]:
+    """Получает следующую пачку строк таблицы users (id > after_user_id) в виде словарей"""
+    result = await db.execute(
+        select(User.__table__)
+        .where(User.id > after_user_id)
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return [dict(row._mapping) for row in result.all()]
+
+
+async def stream_rows_for_users(db: AsyncSession, model, user_ids: List[int], batch_size: int = 1000) -> AsyncIterator[dict]:
+    """Построчно отдает строки таблицы модели, принадлежащие указанным пользователям (по колонке user_id)"""
+    result = await db.stream(
+        select(model.__table__)
+        .where(model.user_id.in_(user_ids))
+        .order_by(model.user_id, model.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async for row in result:
+        yield dict(row._mapping)
+
+
+# Cohort analytics CRUD
+async def stream_sphere_daily_rows(
+    db: AsyncSession,
+    start_day: date_type,
+    end_day: date_type,
+    batch_size: int = 5000
+) -> AsyncIterator[tuple]:
+    """Дневные агрегаты оценок всех пользователей за дни [start_day, end_day): (day, sphere, rating_sum, rating_count)"""
+    result = await db.stream(
+        select(UserSphereDaily.day, UserSphereDaily.sphere, UserSphereDaily.rating_sum, UserSphereDaily.rating_count)
+        .where(and_(UserSphereDaily.day >= start_day, UserSphereDaily.day < end_day))
+        .execution_options(yield_per=batch_size)
+    )
+    async for row in result:
+        yield tuple(row)
+
+
+async def stream_answer_daily_rows(
+    db: AsyncSession,
+    start_day: date_type,
+    end_day: date_type,
+    batch_size: int = 5000
+) -> AsyncIterator[tuple]:
+    """Дневное количество ответов всех пользователей за дни [start_day, end_day): (user_id, day, answers_count)"""
+    result = await db.stream(
+        select(UserAnswerDaily.user_id, UserAnswerDaily.day, UserAnswerDaily.answers_count)
+        .where(and_(UserAnswerDaily.day >= start_day, UserAnswerDaily.day < end_day))
+        .execution_options(yield_per=batch_size)
+    )
+    async for row in result:
+        yield tuple(row)
+
+
+async def stream_user_signups(db: AsyncSession, batch_size: int = 5000) -> AsyncIterator[tuple]:
+    """Даты регистрации всех пользователей: (user_id, created_at)"""
+    result = await db.stream(
+        select(User.id, User.created_at).execution_options(yield_per=batch_size)
+    )
+    async for row in result:
+        yield tuple(row)
+
+
+async def get_focus_sphere_distribution(db: AsyncSession) -> List[tuple]:
+    """Количество пользователей, выбравших каждую сферу фокусом: (sphere, users)"""
+    result = await db.execute(
+        select(UserFocusSphere.sphere, func.count(func.distinct(UserFocusSphere.user_id)))
+        .group_by(UserFocusSphere.sphere)
+        .order_by(func.count(func.distinct(UserFocusSphere.user_id)).desc())
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def get_cohort_weekly_stats(db: AsyncSession, start_week: date_type, end_week: date_type) -> List[CohortWeeklyStat]:
+    """Сохраненные метрики недель, начинающихся в [start_week, end_week)"""
+    result = await db.execute(
+        select(CohortWeeklyStat)
+        .where(and_(CohortWeeklyStat.week_start >= start_week, CohortWeeklyStat.week_start < end_week))
+        .order_by(CohortWeeklyStat.week_start)
+    )
+    return list(result.scalars().all())
+
+
+async def save_cohort_weekly_stats(db: AsyncSession, stats: List[dict]):
+    db.add_all([CohortWeeklyStat(**row) for row in stats])
+    await db.commit()
+
+
+# Журнал сбросов кэшей для нескольких воркеров
+async def add_cache_invalidations(db: AsyncSession, cache: str, keys: List[Optional[int]], source: str):
+    await db.execute(insert(CacheInvalidation), [{"cache": cache, "key": key, "source": source} for key in keys])
+    await db.commit()
+
+
+async def get_last_cache_invalidation_id(db: AsyncSession) -> int:
+    result = await db.execute(select(func.max(CacheInvalidation.id)))
+    return result.scalar() or 0
+
+
+async def get_cache_invalidations(db: AsyncSession, after_id: int, limit: int = 1000) -> List[tuple]:
+    """Сбросы кэшей после after_id: (id, cache, key, source) по возрастанию id"""
+    result = await db.execute(
+        select(CacheInvalidation.id, CacheInvalidation.cache, CacheInvalidation.key, CacheInvalidation.source)
+        .where(CacheInvalidation.id > after_id)
+        .order_by(CacheInvalidation.id)
+        .limit(limit)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def delete_cache_invalidations(db: AsyncSession, before: datetime) -> int:
+    """Удаляет записи журнала сбросов старше before. Возвращает количество удаленных записей"""
+    result = await db.execute(delete(CacheInvalidation).where(CacheInvalidation.created_at < before))
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,73 @@
+"""
+Межпроцессные блокировки на файлах рядом с БД для запуска нескольких воркеров uvicorn:
+- startup_lock - создание схемы, миграции и начальные данные выполняет первый воркер, остальные ждут его
+- acquire_leader - фоновые задачи (ночная агрегация, удаление гостей) запускает только один воркер,
+  остальные периодически повторяют попытку и подхватывают задачи, если ведущий завершится
+На системах без fcntl (Windows) блокировки не используются - там поддерживается только один процесс.
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional, TextIO
+from backend.config import settings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Файл блокировки ведущего воркера держится открытым до завершения процесса
+_leader_file: Optional[TextIO] = None
+
+
+def _lock_path(name: str) -> str:
+    db_path = settings.get_database_path()
+    if db_path is None:
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        db_path = os.path.join(project_root, "antichaos")
+    return f"{db_path}.{name}.lock"
+
+
+@asynccontextmanager
+async def startup_lock():
+    """Эксклюзивная блокировка на время подготовки БД при запуске: остальные воркеры ждут ее освобождения"""
+    if fcntl is None:
+        yield
+        return
+
+    with open(_lock_path("startup"), "a") as lock_file:
+        await asyncio.to_thread(fcntl.flock, lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def acquire_leader() -> bool:
+    """
+    Пытается стать ведущим воркером без ожидания. Блокировка снимается системой при завершении процесса,
+    поэтому перезапущенный вместо ведущего воркер снова сможет ее получить.
+    """
+    global _leader_file
+    if fcntl is None or _leader_file is not None:
+        return True
+
+    lock_file = open(_lock_path("leader"), "a")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _leader_file = lock_file
+    return True
+
+
+def release_leader():
+    global _leader_file
+    if _leader_file is not None:
+        fcntl.flock(_leader_file.fileno(), fcntl.LOCK_UN)
+        _leader_file.close()
+        _leader_file = None
@@ -0,0 +1,75 @@
+"""
+Миграция для создания полнотекстового индекса FTS5 answers_fts по тексту ответов.
+Индекс хранит только токены (content='answers') и синхронизируется с таблицей answers триггерами.
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+# Триггеры синхронизации индекса при вставке, удалении и изменении ответов
+TRIGGERS = {
+    "answers_fts_insert": """
+        CREATE TRIGGER answers_fts_insert AFTER INSERT ON answers BEGIN
+            INSERT INTO answers_fts(rowid, answer) VALUES (new.id, new.answer);
+        END
+    """,
+    "answers_fts_delete": """
+        CREATE TRIGGER answers_fts_delete AFTER DELETE ON answers BEGIN
+            INSERT INTO answers_fts(answers_fts, rowid, answer) VALUES ('delete', old.id, old.answer);
+        END
+    """,
+    "answers_fts_update": """
+        CREATE TRIGGER answers_fts_update AFTER UPDATE OF answer ON answers BEGIN
+            INSERT INTO answers_fts(answers_fts, rowid, answer) VALUES ('delete', old.id, old.answer);
+            INSERT INTO answers_fts(rowid, answer) VALUES (new.id, new.answer);
+        END
+    """,
+}
+
+
+async def migrate():
+    """Создает таблицу answers_fts, триггеры синхронизации и индексирует существующие ответы"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование таблицы индекса
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name='answers_fts'"
+        )
+        table_exists = await cursor.fetchone()
+        
+        # Создаем индекс и заполняем его существующими ответами
+        if not table_exists:
+            await db.execute(
+                "CREATE VIRTUAL TABLE answers_fts USING fts5("
+                "answer, content='answers', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+            await db.execute("INSERT INTO answers_fts(answers_fts) VALUES ('rebuild')")
+            print("Создан полнотекстовый индекс answers_fts")
+        
+        for name, sql in TRIGGERS.items():
+            # Проверяем существование триггера
+            cursor = await db.execute(
+                "SELECT name FROM sqlite_master WHERE type='trigger' AND name=?", (name,)
+            )
+            if not await cursor.fetchone():
+                await db.execute(sql)
+                print(f"Создан триггер {name}")
+        
+        await db.commit()
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
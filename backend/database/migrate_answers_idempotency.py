@@ -0,0 +1,55 @@
+"""
+Миграция для добавления поля idempotency_key в таблицу answers и уникального индекса (user_id, idempotency_key)
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+
+async def migrate():
+    """Добавляет поле idempotency_key в таблицу answers и создает индекс ux_answers_user_idempotency"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование колонки
+        cursor = await db.execute("PRAGMA table_info(answers)")
+        columns = await cursor.fetchall()
+        existing_columns = [col[1] for col in columns]
+        
+        # Добавляем колонку idempotency_key, если её нет
+        if "idempotency_key" not in existing_columns:
+            await db.execute(
+                "ALTER TABLE answers ADD COLUMN idempotency_key TEXT"
+            )
+            print("Добавлена колонка idempotency_key")
+        
+        # Проверяем существование индекса
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND name='ux_answers_user_idempotency'"
+        )
+        index_exists = await cursor.fetchone()
+        
+        # Создаем уникальный индекс, если его нет (NULL-ключи старых ответов не конфликтуют)
+        if not index_exists:
+            await db.execute(
+                "CREATE UNIQUE INDEX ux_answers_user_idempotency ON answers(user_id, idempotency_key)"
+            )
+            print("Создан индекс ux_answers_user_idempotency")
+        
+        await db.commit()
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
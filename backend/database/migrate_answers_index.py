@@ -0,0 +1,43 @@
+"""
+Миграция для создания составного индекса (user_id, date, id) в таблице answers для keyset-пагинации истории ответов
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+
+async def migrate():
+    """Создает составной индекс ix_answers_user_date"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование индекса
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND name='ix_answers_user_date'"
+        )
+        index_exists = await cursor.fetchone()
+        
+        # Создаем индекс, если его нет
+        if not index_exists:
+            await db.execute(
+                "CREATE INDEX ix_answers_user_date ON answers(user_id, date, id)"
+            )
+            print("Создан индекс ix_answers_user_date")
+        
+        await db.commit()
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
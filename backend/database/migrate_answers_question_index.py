@@ -0,0 +1,43 @@
+"""
+Миграция для создания индекса по question_id в таблице answers (удаление ответов вместе с вопросами и сферами)
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+
+async def migrate():
+    """Создает индекс ix_answers_question_id"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование индекса
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND name='ix_answers_question_id'"
+        )
+        index_exists = await cursor.fetchone()
+        
+        # Создаем индекс, если его нет
+        if not index_exists:
+            await db.execute(
+                "CREATE INDEX ix_answers_question_id ON answers(question_id)"
+            )
+            print("Создан индекс ix_answers_question_id")
+        
+        await db.commit()
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,63 @@
+"""
+Миграция для пересоздания таблицы cache_invalidations с AUTOINCREMENT.
+Без него SQLite после ночной очистки журнала снова выдает id с 1, и воркеры, читающие записи с id > last_id,
+пропускают новые сбросы. Записи журнала переносятся в новую таблицу, счетчик id продолжается с максимального.
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+
+async def migrate():
+    """Пересоздает таблицу cache_invalidations с PRIMARY KEY AUTOINCREMENT, если она создана без него"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование таблицы и ее определение
+        cursor = await db.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name='cache_invalidations'"
+        )
+        row = await cursor.fetchone()
+        if not row:
+            print("Таблица cache_invalidations не найдена, пропускаем миграцию")
+            return
+        if "AUTOINCREMENT" in row[0].upper():
+            return
+        
+        await db.execute("ALTER TABLE cache_invalidations RENAME TO cache_invalidations_old")
+        await db.execute("DROP INDEX IF EXISTS ix_cache_invalidations_id")
+        await db.execute("DROP INDEX IF EXISTS ix_cache_invalidations_created_at")
+        await db.execute(
+            "CREATE TABLE cache_invalidations ("
+            "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+            "cache VARCHAR NOT NULL, "
+            "\"key\" INTEGER, "
+            "source VARCHAR NOT NULL, "
+            "created_at DATETIME)"
+        )
+        await db.execute("CREATE INDEX ix_cache_invalidations_id ON cache_invalidations (id)")
+        await db.execute("CREATE INDEX ix_cache_invalidations_created_at ON cache_invalidations (created_at)")
+        await db.execute(
+            "INSERT INTO cache_invalidations (id, cache, \"key\", source, created_at) "
+            "SELECT id, cache, \"key\", source, created_at FROM cache_invalidations_old"
+        )
+        await db.execute("DROP TABLE cache_invalidations_old")
+        
+        await db.commit()
+        print("Таблица cache_invalidations пересоздана с AUTOINCREMENT")
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
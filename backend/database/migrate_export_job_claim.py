@@ -0,0 +1,48 @@
+"""
+Миграция для добавления полей claimed_by и heartbeat_at в таблицу export_jobs
+(задачу экспорта захватывает один воркер, состояние хранится в БД, а не в памяти процесса)
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+
+async def migrate():
+    """Добавляет поля claimed_by и heartbeat_at в таблицу export_jobs"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование колонок
+        cursor = await db.execute("PRAGMA table_info(export_jobs)")
+        columns = await cursor.fetchall()
+        existing_columns = [col[1] for col in columns]
+        
+        if not existing_columns:
+            print("Таблица export_jobs не найдена, пропускаем миграцию")
+            return
+        
+        if "claimed_by" not in existing_columns:
+            await db.execute("ALTER TABLE export_jobs ADD COLUMN claimed_by VARCHAR")
+            print("Добавлена колонка claimed_by")
+        
+        if "heartbeat_at" not in existing_columns:
+            await db.execute("ALTER TABLE export_jobs ADD COLUMN heartbeat_at DATETIME")
+            print("Добавлена колонка heartbeat_at")
+        
+        await db.commit()
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
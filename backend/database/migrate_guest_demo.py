@@ -0,0 +1,42 @@
+"""
+Миграция для добавления поля demo_data_pending в таблицу users (демо-данные гостей создаются лениво)
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+
+async def migrate():
+    """Добавляет поле demo_data_pending в таблицу users"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Проверяем существование колонки
+        cursor = await db.execute("PRAGMA table_info(users)")
+        columns = await cursor.fetchall()
+        existing_columns = [col[1] for col in columns]
+        
+        # Добавляем колонку demo_data_pending, если её нет (существующие гости уже с данными)
+        if "demo_data_pending" not in existing_columns:
+            await db.execute(
+                "ALTER TABLE users ADD COLUMN demo_data_pending BOOLEAN NOT NULL DEFAULT 0"
+            )
+            print("Добавлена колонка demo_data_pending")
+        
+        await db.commit()
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
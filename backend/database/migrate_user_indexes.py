@@ -0,0 +1,49 @@
+"""
+Миграция для создания индексов по user_id в таблицах user_spheres и user_focus_spheres
+(проверка активности и пакетное удаление пользователей)
+"""
+import asyncio
+import aiosqlite
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from backend.config import settings
+
+# Имя индекса -> SQL создания
+INDEXES = {
+    "ix_user_spheres_user_date": "CREATE INDEX ix_user_spheres_user_date ON user_spheres(user_id, date)",
+    "ix_user_focus_spheres_user_id": "CREATE INDEX ix_user_focus_spheres_user_id ON user_focus_spheres(user_id)",
+}
+
+
+async def migrate():
+    """Создает индексы ix_user_spheres_user_date и ix_user_focus_spheres_user_id"""
+    db_path = settings.database_url.replace("sqlite+aiosqlite:///", "")
+    
+    # Если путь относительный, делаем его абсолютным относительно корня проекта
+    if not os.path.isabs(db_path):
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+        db_path = os.path.join(project_root, db_path)
+    
+    async with aiosqlite.connect(db_path) as db:
+        for name, sql in INDEXES.items():
+            # Проверяем существование индекса
+            cursor = await db.execute(
+                "SELECT name FROM sqlite_master WHERE type='index' AND name=?", (name,)
+            )
+            index_exists = await cursor.fetchone()
+            
+            # Создаем индекс, если его нет
+            if not index_exists:
+                await db.execute(sql)
+                print(f"Создан индекс {name}")
+        
+        await db.commit()
+        print("Миграция завершена успешно")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, Date, Float, ForeignKey, Boolean, Text, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.database.database import Base
@@ -17,19 +17,30 @@ class User(Base):
     birth_date = Column(DateTime, nullable=True)  # Дата рождения
     created_at = Column(DateTime, default=datetime.utcnow)
     ip_address = Column(String, nullable=True, index=True)  # IP адрес для гостевых пользователей
+    demo_data_pending = Column(Boolean, default=False, nullable=False)  # Демо-данные гостя еще не созданы
     
     spheres = relationship("UserSphere", back_populates="user", cascade="all, delete-orphan")
     answers = relationship("Answer", back_populates="user", cascade="all, delete-orphan")
     focus_spheres = relationship("UserFocusSphere", back_populates="user", cascade="all, delete-orphan")
     settings = relationship("UserSettings", back_populates="user", uselist=False, cascade="all, delete-orphan")
     subscription = relationship("Subscription", back_populates="user", uselist=False, cascade="all, delete-orphan")
+    schedule_day = relationship("UserScheduleDay", back_populates="user", uselist=False, cascade="all, delete-orphan")
+    answered_bitmap = relationship("UserAnsweredBitmap", back_populates="user", uselist=False, cascade="all, delete-orphan")
+    progress_snapshot = relationship("UserProgressSnapshot", back_populates="user", uselist=False, cascade="all, delete-orphan")
+    sphere_daily = relationship("UserSphereDaily", back_populates="user", cascade="all, delete-orphan")
+    answer_daily = relationship("UserAnswerDaily", back_populates="user", cascade="all, delete-orphan")
+    rollup_state = relationship("UserRollupState", back_populates="user", uselist=False, cascade="all, delete-orphan")
+    streak = relationship("UserStreak", back_populates="user", uselist=False, cascade="all, delete-orphan")
 
 
 class UserSphere(Base):
     __tablename__ = "user_spheres"
+    __table_args__ = (
+        Index("ix_user_spheres_user_date", "user_id", "date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     sphere = Column(String, nullable=False)  # health, relationships, money, energy, career, other
     rating = Column(Integer, nullable=False)  # 1-10
     date = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -52,12 +63,18 @@ class Question(Base):
 
 class Answer(Base):
     __tablename__ = "answers"
+    __table_args__ = (
+        Index("ix_answers_user_date", "user_id", "date", "id"),
+        Index("ix_answers_question_id", "question_id"),
+        Index("ux_answers_user_idempotency", "user_id", "idempotency_key", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
     answer = Column(Text, nullable=False)
     date = Column(DateTime, default=datetime.utcnow, nullable=False)
+    idempotency_key = Column(String, nullable=True)  # Ключ из заголовка Idempotency-Key (повторы запроса не создают дублей)
     
     user = relationship("User", back_populates="answers")
     question = relationship("Question", back_populates="answers")
@@ -67,7 +84,7 @@ class UserFocusSphere(Base):
     __tablename__ = "user_focus_spheres"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     sphere = Column(String, nullable=False)
     selected_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
@@ -78,7 +95,7 @@ class Subscription(Base):
     __tablename__ = "subscriptions"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
     plan = Column(String, nullable=False)  # free, premium
     expires_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -90,7 +107,7 @@ class UserSettings(Base):
     __tablename__ = "user_settings"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
     notification_time = Column(String, nullable=True)  # HH:MM format
     language = Column(String, default="ru")
     is_paused = Column(Boolean, default=False)
@@ -104,20 +121,119 @@ class UserSettings(Base):
 
 class QuestionSchedule(Base):
     """
-    Заглушка для модели расписания вопросов.
-    Позже будет заполнена списком вопросов для каждого дня.
+    Модель расписания вопросов.
+    Для каждого дня расписания и сферы хранит вопросы, которые показываются пользователю в этот день.
     """
     __tablename__ = "question_schedule"
+    __table_args__ = (
+        Index("ix_question_schedule_day_sphere", "day_number", "sphere"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     day_number = Column(Integer, nullable=False)  # Номер дня (1, 2, 3, ...)
-    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
     sphere = Column(String, nullable=False)  # Сфера жизни
     created_at = Column(DateTime, default=datetime.utcnow)
     
     question = relationship("Question")
 
 
+class UserScheduleDay(Base):
+    """
+    Счетчик дней расписания вопросов для пользователя.
+    Увеличивается на 1 в каждый новый день, когда пользователь получает вопрос дня,
+    и сбрасывается при изменении фокус-сфер.
+    """
+    __tablename__ = "user_schedule_days"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
+    day_number = Column(Integer, default=1, nullable=False)  # Текущий день расписания (1, 2, 3, ...)
+    last_advanced_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # Когда счетчик последний раз менялся
+    
+    user = relationship("User", back_populates="schedule_day")
+
+
+class UserAnsweredBitmap(Base):
+    """
+    Битовая карта вопросов, на которые пользователь ответил с момента выбора фокус-сфер.
+    Бит с номером question_id установлен, если на вопрос есть ответ начиная с since.
+    """
+    __tablename__ = "user_answered_bitmaps"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
+    since = Column(DateTime, nullable=False)  # Начало периода (момент выбора фокус-сфер)
+    bits = Column(LargeBinary, default=b"", nullable=False)  # Битовая карта в little-endian
+    
+    user = relationship("User", back_populates="answered_bitmap")
+
+
+class UserProgressSnapshot(Base):
+    """
+    Снимок данных для отчетов о прогрессе пользователя, обновляется при записи оценок и ответов.
+    Хранит последние оценки по сферам, оценки и даты ответов за последние 30 дней
+    и базовые оценки (последние оценки до начала 30-дневного окна). Поля - JSON в виде текста.
+    """
+    __tablename__ = "user_progress_snapshot"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
+    latest_ratings = Column(Text, default="{}", nullable=False)  # {сфера: [дата, id, оценка]}
+    recent_ratings = Column(Text, default="[]", nullable=False)  # [[дата, id, сфера, оценка], ...] по возрастанию даты
+    baseline_ratings = Column(Text, default="{}", nullable=False)  # {сфера: [дата, id, оценка]} до начала окна
+    recent_answers = Column(Text, default="[]", nullable=False)  # [дата, ...] по возрастанию
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    user = relationship("User", back_populates="progress_snapshot")
+
+
+class UserSphereDaily(Base):
+    """Дневные агрегаты оценок сфер пользователя: сумма, количество и последняя оценка за день"""
+    __tablename__ = "user_sphere_daily"
+    __table_args__ = (
+        Index("ux_user_sphere_daily", "user_id", "day", "sphere", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    sphere = Column(String, nullable=False)
+    rating_sum = Column(Integer, nullable=False)
+    rating_count = Column(Integer, nullable=False)
+    last_rating = Column(Integer, nullable=False)
+    last_rating_at = Column(DateTime, nullable=False)  # Время последней оценки за день
+    
+    user = relationship("User", back_populates="sphere_daily")
+
+
+class UserAnswerDaily(Base):
+    """Количество ответов пользователя за день"""
+    __tablename__ = "user_answer_daily"
+    __table_args__ = (
+        Index("ux_user_answer_daily", "user_id", "day", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    answers_count = Column(Integer, nullable=False)
+    
+    user = relationship("User", back_populates="answer_daily")
+
+
+class UserRollupState(Base):
+    """Граница дневных агрегатов пользователя: все дни до rolled_up_to (не включая) уже агрегированы"""
+    __tablename__ = "user_rollup_states"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
+    rolled_up_to = Column(Date, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    user = relationship("User", back_populates="rollup_state")
+
+
 class Sphere(Base):
     """
     Модель для хранения определений сфер жизни.
@@ -132,3 +248,104 @@ class Sphere(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+
+
+class ExportJob(Base):
+    """
+    Фоновая задача массового экспорта данных всех пользователей в файлы.
+    Пользователи обрабатываются пачками по возрастанию id, после каждой пачки
+    сохраняется last_user_id, поэтому прерванную задачу можно продолжить.
+    """
+    __tablename__ = "export_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="pending", nullable=False)  # pending, running, completed, failed
+    output_dir = Column(String, nullable=False)  # Каталог с файлами экспорта
+    last_user_id = Column(Integer, default=0, nullable=False)  # Последний выгруженный пользователь
+    batches_written = Column(Integer, default=0, nullable=False)
+    users_exported = Column(Integer, default=0, nullable=False)
+    rows_exported = Column(Integer, default=0, nullable=False)
+    bytes_written = Column(Integer, default=0, nullable=False)
+    elapsed_seconds = Column(Float, default=0.0, nullable=False)  # Суммарное время работы (для расчета скорости)
+    error = Column(Text, nullable=True)
+    created_by = Column(Integer, nullable=True)  # ID админа, запустившего экспорт
+    claimed_by = Column(String, nullable=True)  # Воркер, выполняющий задачу (NULL - не выполняется)
+    heartbeat_at = Column(DateTime, nullable=True)  # Последнее подтверждение выполнения (после каждой пачки)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class UserStreak(Base):
+    """Серия дней подряд с ответами и счетчики активности пользователя, обновляются при каждом ответе"""
+    __tablename__ = "user_streaks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
+    current_streak = Column(Integer, default=0, nullable=False)  # Дней подряд до last_answer_day включительно
+    longest_streak = Column(Integer, default=0, nullable=False)
+    last_answer_day = Column(Date, nullable=True)  # День последнего ответа (UTC)
+    total_answers = Column(Integer, default=0, nullable=False)
+    
+    user = relationship("User", back_populates="streak")
+
+
+class QuestionStat(Base):
+    """Статистика использования вопроса: сколько раз показан и отвечен (пополняется пачками из памяти процесса)"""
+    __tablename__ = "question_stats"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), unique=True, nullable=False)
+    times_served = Column(Integer, default=0, nullable=False)  # Показан пользователю (не чаще раза в день на пользователя)
+    times_answered = Column(Integer, default=0, nullable=False)
+    last_served_at = Column(DateTime, nullable=True)
+    last_answered_at = Column(DateTime, nullable=True)
+    
+    question = relationship("Question")
+
+
+class QuestionServedDay(Base):
+    """
+    Показы вопроса пользователю по дням UTC: при нескольких воркерах по ним показ учитывается
+    в question_stats один раз в день на пользователя. Записи прошлых дней удаляются ночной задачей.
+    """
+    __tablename__ = "question_served_days"
+    __table_args__ = (
+        Index("ux_question_served_days", "day", "user_id", "question_id", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    question_id = Column(Integer, nullable=False)
+
+
+class CohortWeeklyStat(Base):
+    """
+    Метрики всех пользователей за завершенную неделю (с понедельника): средние оценки сфер,
+    число активных пользователей и ответов. Считаются пакетно и больше не пересчитываются.
+    """
+    __tablename__ = "cohort_weekly_stats"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    week_start = Column(Date, unique=True, nullable=False)
+    users_total = Column(Integer, nullable=False)  # Пользователи, зарегистрированные до конца недели
+    active_users = Column(Integer, nullable=False)  # Пользователи, ответившие хотя бы на один вопрос
+    answers_count = Column(Integer, nullable=False)
+    sphere_averages = Column(Text, default="{}", nullable=False)  # {сфера: [средняя оценка, количество оценок]}
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CacheInvalidation(Base):
+    """
+    Журнал сбросов кэшей в памяти процесса для режима нескольких воркеров:
+    каждый воркер читает новые записи и сбрасывает у себя соответствующий кэш.
+    """
+    __tablename__ = "cache_invalidations"
+    # AUTOINCREMENT: id не переиспользуются после очистки журнала, иначе воркеры пропустят новые записи (id > last_id)
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache = Column(String, nullable=False)  # questions - банк вопросов и расписание, reports - отчеты о прогрессе
+    key = Column(Integer, nullable=True)  # user_id для reports (NULL - весь кэш)
+    source = Column(String, nullable=False)  # Воркер, выполнивший сброс (свои записи он пропускает)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
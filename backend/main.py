@@ -1,10 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 from backend.config import settings
 from backend.api import users, questions, answers, progress, settings as settings_api, spheres
+from backend.api.responses import FastJSONResponse
+from backend.services import metrics
 from backend.database.database import engine, Base, AsyncSessionLocal
+from backend.database.locks import startup_lock, release_leader
 from backend.database.models import Question
 from sqlalchemy import select
 import logging
@@ -13,19 +18,25 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Версия подготовки БД (PRAGMA user_version): увеличивается при добавлении миграции в prepare_database
+SCHEMA_VERSION = 2
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Управление жизненным циклом приложения"""
-    # Startup
-    logger.info("Запуск приложения...")
-    logger.info(f"Database URL: {settings.database_url}")
+
+async def prepare_database():
+    """
+    Создание таблиц, миграции и вопросы по умолчанию (выполняется под startup_lock).
+    Воркер, который находит БД уже подготовленной к SCHEMA_VERSION, ничего не делает.
+    """
+    # Несколько воркеров пишут в один файл SQLite: журнал WAL не блокирует чтение на время записи
+    if settings.web_concurrency > 1 and settings.get_database_path():
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql("PRAGMA journal_mode=WAL")
     
-    # Импортируем все модели для регистрации в Base.metadata
-    from backend.database.models import (
-        User, UserSphere, Sphere, Answer, UserFocusSphere,
-        Subscription, UserSettings, QuestionSchedule
-    )
+    async with engine.connect() as conn:
+        schema_version = (await conn.exec_driver_sql("PRAGMA user_version")).scalar()
+    if schema_version >= SCHEMA_VERSION:
+        logger.info(f"БД уже подготовлена (версия {schema_version}), миграции пропускаются")
+        return
     
     # Создаем таблицы БД
     logger.info("Создание таблиц БД...")
@@ -43,14 +54,40 @@ async def lifespan(app: FastAPI):
     from backend.database.migrate_user_profile import migrate as migrate_user_profile
     from backend.database.migrate_spheres import migrate as migrate_spheres
     from backend.database.migrate_guest_ip import migrate as migrate_guest_ip
+    from backend.database.migrate_question_schedule import migrate as migrate_question_schedule
+    from backend.database.migrate_answers_index import migrate as migrate_answers_index
+    from backend.database.migrate_guest_demo import migrate as migrate_guest_demo
+    from backend.database.migrate_user_indexes import migrate as migrate_user_indexes
+    from backend.database.migrate_answers_question_index import migrate as migrate_answers_question_index
+    from backend.database.migrate_answers_idempotency import migrate as migrate_answers_idempotency
+    from backend.database.migrate_answers_fts import migrate as migrate_answers_fts
+    from backend.database.migrate_cache_invalidations import migrate as migrate_cache_invalidations
+    from backend.database.migrate_export_job_claim import migrate as migrate_export_job_claim
+    from backend.database.backfill_streaks import backfill as backfill_streaks
+    from backend.database.backfill_question_stats import backfill as backfill_question_stats
     try:
         await migrate_settings()
         await migrate_user_profile()
         await migrate_spheres()
         await migrate_guest_ip()
+        await migrate_question_schedule()
+        await migrate_answers_index()
+        await migrate_guest_demo()
+        await migrate_user_indexes()
+        await migrate_answers_question_index()
+        await migrate_answers_idempotency()
+        await migrate_answers_fts()
+        await migrate_cache_invalidations()
+        await migrate_export_job_claim()
+        await backfill_streaks()
+        await backfill_question_stats()
         logger.info("Миграции выполнены успешно")
     except Exception as e:
         logger.warning(f"Ошибка при выполнении миграций (может быть нормально, если миграции уже выполнены): {e}")
+        # Версия не сохраняется, следующий запуск повторит миграции
+        migrations_failed = True
+    else:
+        migrations_failed = False
     
     # Создаем вопросы по умолчанию, если их нет
     logger.info("Проверка вопросов по умолчанию...")
@@ -106,6 +143,43 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"Ошибка при создании вопросов по умолчанию: {e}", exc_info=True)
             await session.rollback()
+            return
+    
+    if not migrations_failed:
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Управление жизненным циклом приложения"""
+    # Startup
+    logger.info("Запуск приложения...")
+    logger.info(f"Database URL: {settings.database_url}")
+    
+    # Импортируем все модели для регистрации в Base.metadata
+    from backend.database.models import (
+        User, UserSphere, Sphere, Answer, UserFocusSphere,
+        Subscription, UserSettings, QuestionSchedule, UserScheduleDay,
+        UserAnsweredBitmap, ExportJob, UserProgressSnapshot, UserSphereDaily,
+        UserAnswerDaily, UserRollupState, CohortWeeklyStat, UserStreak, QuestionStat,
+        QuestionServedDay, CacheInvalidation
+    )
+    
+    # Схема, миграции и начальные данные - первым воркером, остальные дожидаются его и пропускают подготовку
+    async with startup_lock():
+        await prepare_database()
+    
+    # Ночная агрегация оценок и ответов по дням - только в ведущем воркере
+    # (остальные периодически пытаются стать ведущим, если текущий завершится)
+    from backend.services.rollup_service import start_rollup_loop, stop_rollup_loop
+    start_rollup_loop()
+    if settings.web_concurrency > 1 and settings.rate_limit_backend != "redis":
+        logger.warning("Лимиты запросов хранятся в памяти каждого воркера, для общего лимита нужен RATE_LIMIT_BACKEND=redis")
+    
+    # Периодическая запись статистики показов и ответов на вопросы
+    from backend.services.question_stats import question_stats
+    question_stats.start()
     
     logger.info("Приложение готово к работе")
     
@@ -113,11 +187,22 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Завершение работы приложения...")
+    from backend.services.archive_service import cancel_running_jobs
+    await cancel_running_jobs()
+    await stop_rollup_loop()
+    from backend.services.write_buffer import write_buffer
+    await write_buffer.stop()
+    await question_stats.stop()
+    release_leader()
     await engine.dispose()
     logger.info("Приложение остановлено")
 
 
-app = FastAPI(title="АнтиChaos Telegram Mini App API", lifespan=lifespan)
+app = FastAPI(
+    title="АнтиChaos Telegram Mini App API",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
 
 # CORS middleware
 # Для локальной разработки добавляем localhost
@@ -138,8 +223,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Сжатие ответов больше GZIP_MINIMUM_SIZE байт (ответы с уже заданным Content-Encoding, например экспорт, не трогаются)
+app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_minimum_size, compresslevel=6)
+
 # Подключаем роутеры
 app.include_router(users.router)
 app.include_router(questions.router)
@@ -160,3 +249,8 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Счетчики процесса в формате Prometheus (nginx проксирует только /api, поэтому endpoint доступен лишь внутри сети)"""
+    return metrics.render_prometheus()
@@ -0,0 +1,130 @@
+import numpy as np
+from datetime import datetime, date, time, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import crud
+from backend.services.cache import report_cache
+from backend.services.rollup_service import rollup_user
+
+# Окно скользящего среднего (дней)
+MOVING_AVERAGE_WINDOW = 7
+
+
+def build_rating_matrix(rows: List[tuple], spheres: List[str], start_day: date, days: int) -> np.ndarray:
+    """
+    Собирает матрицу средних дневных оценок: строка - сфера, столбец - день начиная со start_day.
+    rows - (day, sphere, rating_sum, rating_count); дни без оценок заполняются NaN.
+    """
+    matrix = np.full((len(spheres), days), np.nan)
+    if not rows:
+        return matrix
+
+    sphere_index = {sphere: i for i, sphere in enumerate(spheres)}
+    row_idx = np.fromiter((sphere_index[row[1]] for row in rows), dtype=np.int64, count=len(rows))
+    col_idx = np.fromiter(((row[0] - start_day).days for row in rows), dtype=np.int64, count=len(rows))
+    sums = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    counts = np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows))
+    matrix[row_idx, col_idx] = sums / counts
+    return matrix
+
+
+def moving_average(matrix: np.ndarray, window: int = MOVING_AVERAGE_WINDOW) -> np.ndarray:
+    """Скользящее среднее по последним window дням для каждого дня (учитываются только дни с оценками)"""
+    observed = ~np.isnan(matrix)
+    values = np.where(observed, matrix, 0.0)
+    zeros = np.zeros((matrix.shape[0], 1))
+    value_sums = np.cumsum(np.hstack([zeros, values]), axis=1)
+    count_sums = np.cumsum(np.hstack([zeros, observed.astype(np.float64)]), axis=1)
+    ends = np.arange(1, matrix.shape[1] + 1)
+    starts = np.maximum(ends - window, 0)
+    window_sums = value_sums[:, ends] - value_sums[:, starts]
+    window_counts = count_sums[:, ends] - count_sums[:, starts]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+
+def compute_trends(matrix: np.ndarray, window: int = MOVING_AVERAGE_WINDOW) -> Dict[str, np.ndarray]:
+    """
+    Считает показатели трендов сразу для всех строк матрицы (сфер пользователя или пользователей когорты):
+    - slope - наклон линейной регрессии оценки по дням (изменение оценки в день)
+    - moving_average - скользящее среднее за последние window дней на последний день
+    - volatility - стандартное отклонение оценок за период
+    - streak - число дней с последнего снижения оценки (с момента первой оценки, если снижений не было)
+    - observations - количество дней с оценками, latest - последняя оценка
+    """
+    rows, days = matrix.shape
+    observed = ~np.isnan(matrix)
+    observations = observed.sum(axis=1)
+    values = np.where(observed, matrix, 0.0)
+    x = np.arange(days, dtype=np.float64)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = (observed * x).sum(axis=1) / observations
+        y_mean = values.sum(axis=1) / observations
+        dx = np.where(observed, x - x_mean[:, None], 0.0)
+        covariance = (dx * (values - y_mean[:, None])).sum(axis=1)
+        variance = (dx * dx).sum(axis=1)
+        slope = np.where(variance > 0, covariance / variance, np.nan)
+        volatility = np.sqrt((np.where(observed, values - y_mean[:, None], 0.0) ** 2).sum(axis=1) / observations)
+
+    # Протягиваем последнюю известную оценку вперед, чтобы сравнивать соседние дни
+    last_seen = np.maximum.accumulate(np.where(observed, np.arange(days), -1), axis=1)
+    filled = np.where(last_seen >= 0, matrix[np.arange(rows)[:, None], np.maximum(last_seen, 0)], np.nan)
+    declines = np.diff(filled, axis=1) < 0
+    first_seen = np.where(observations > 0, observed.argmax(axis=1), days - 1)
+    last_decline = np.where(declines, np.arange(1, days), -1).max(axis=1, initial=-1)
+    streak = np.where(observations > 0, days - 1 - np.maximum(last_decline, first_seen), 0)
+
+    return {
+        "slope": slope,
+        "moving_average": moving_average(matrix, window)[:, -1] if days else np.full(rows, np.nan),
+        "volatility": np.where(observations > 0, volatility, np.nan),
+        "streak": streak,
+        "observations": observations,
+        "latest": filled[:, -1] if days else np.full(rows, np.nan)
+    }
+
+
+def _to_float(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+async def get_rating_trends(db: AsyncSession, user_id: int, days: int = 90) -> Dict:
+    """Тренды оценок всех сфер пользователя за days дней (из кэша отчетов, если он еще актуален)"""
+    return await report_cache.get_or_compute(user_id, f"trends:{days}", lambda: _build_rating_trends(db, user_id, days))
+
+
+async def _build_rating_trends(db: AsyncSession, user_id: int, days: int) -> Dict:
+    now = datetime.utcnow()
+    today = now.date()
+    start_day = today - timedelta(days=days - 1)
+
+    # Завершенные дни - из дневных агрегатов, сегодняшний день - из исходных оценок
+    await rollup_user(db, user_id, today)
+    rows = await crud.get_sphere_daily_rows(db, user_id, start_day, today)
+    today_totals = {}
+    for _, sphere, rating, _ in await crud.get_user_ratings_between(db, user_id, datetime.combine(today, time.min)):
+        total = today_totals.setdefault(sphere, [0, 0])
+        total[0] += rating
+        total[1] += 1
+    rows += [(today, sphere, total[0], total[1]) for sphere, total in today_totals.items()]
+
+    spheres = sorted({row[1] for row in rows})
+    trends = compute_trends(build_rating_matrix(rows, spheres, start_day, days))
+
+    return {
+        'period_days': days,
+        'start': start_day,
+        'end': today,
+        'spheres': {
+            sphere: {
+                'slope': _to_float(trends['slope'][i]),
+                'moving_average': _to_float(trends['moving_average'][i]),
+                'volatility': _to_float(trends['volatility'][i]),
+                'streak_days': int(trends['streak'][i]),
+                'observations': int(trends['observations'][i]),
+                'latest': _to_float(trends['latest'][i])
+            }
+            for i, sphere in enumerate(spheres)
+        }
+    }
@@ -0,0 +1,187 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+from backend.config import settings
+from backend.database import crud
+from backend.database.database import AsyncSessionLocal
+from backend.database.models import ExportJob, UserSphere, Answer, UserFocusSphere, UserSettings
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, которые выгружаются по пользователям (колонка user_id)
+USER_TABLES = {
+    "user_spheres": UserSphere,
+    "answers": Answer,
+    "user_focus_spheres": UserFocusSphere,
+    "user_settings": UserSettings,
+}
+
+# Задача без подтверждения выполнения дольше этого срока считается брошенной (воркер завершился)
+# и может быть продолжена другим воркером; подтверждение пишется после каждой пачки
+EXPORT_JOB_STALE_SECONDS = 300
+
+# Воркер, захватывающий задачи экспорта (claimed_by в export_jobs)
+_worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+# Запущенные в этом процессе задачи экспорта (для остановки при завершении)
+_running_jobs: Dict[int, asyncio.Task] = {}
+
+
+def get_export_root() -> str:
+    """Каталог для файлов экспорта (относительный путь считается от корня проекта)"""
+    if os.path.isabs(settings.export_dir):
+        return settings.export_dir
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(project_root, settings.export_dir)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _write_partition(path: str, rows: List[dict]) -> int:
+    """
+    Записывает строки в сжатый NDJSON-файл. Файл сначала пишется во временный
+    и затем переименовывается, поэтому после сбоя не остается частично записанных партиций.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, default=_json_default))
+            f.write("\n")
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def export_job_to_dict(job: ExportJob) -> dict:
+    rows_per_second = job.rows_exported / job.elapsed_seconds if job.elapsed_seconds else 0.0
+    return {
+        "id": job.id,
+        "status": job.status,
+        "is_active": is_job_active(job),
+        "output_dir": job.output_dir,
+        "last_user_id": job.last_user_id,
+        "batches_written": job.batches_written,
+        "users_exported": job.users_exported,
+        "rows_exported": job.rows_exported,
+        "bytes_written": job.bytes_written,
+        "elapsed_seconds": round(job.elapsed_seconds, 3),
+        "rows_per_second": round(rows_per_second, 1),
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+async def run_export_job(job_id: int):
+    """
+    Выполняет задачу массового экспорта: выгружает пользователей пачками по возрастанию id.
+    Для каждой пачки пишет по одному файлу на таблицу: <output_dir>/<table>/part-<номер>.ndjson.gz.
+    После каждой пачки сохраняет прогресс, поэтому задачу можно продолжить с места остановки.
+    Задача должна быть захвачена этим воркером (start_export_job).
+    """
+    async with AsyncSessionLocal() as db:
+        job = await crud.get_export_job(db, job_id)
+        if not job:
+            return
+
+        logger.info(f"Экспорт #{job.id}: старт с пользователя id > {job.last_user_id}")
+
+        try:
+            while True:
+                batch_started = time.perf_counter()
+                users = await crud.get_user_rows_after(db, job.last_user_id, settings.export_batch_users)
+                if not users:
+                    break
+
+                user_ids = [user["id"] for user in users]
+                part_name = f"part-{job.batches_written:06d}.ndjson.gz"
+                rows_count = len(users)
+                bytes_count = await asyncio.to_thread(
+                    _write_partition, os.path.join(job.output_dir, "users", part_name), users
+                )
+
+                for table_name, model in USER_TABLES.items():
+                    rows = [row async for row in crud.stream_rows_for_users(db, model, user_ids)]
+                    rows_count += len(rows)
+                    bytes_count += await asyncio.to_thread(
+                        _write_partition, os.path.join(job.output_dir, table_name, part_name), rows
+                    )
+
+                job.last_user_id = user_ids[-1]
+                job.batches_written += 1
+                job.users_exported += len(users)
+                job.rows_exported += rows_count
+                job.bytes_written += bytes_count
+                job.elapsed_seconds += time.perf_counter() - batch_started
+                job.heartbeat_at = datetime.utcnow()
+                await db.commit()
+
+            job.status = "completed"
+            job.claimed_by = None
+            job.finished_at = datetime.utcnow()
+            await db.commit()
+            stats = export_job_to_dict(job)
+            logger.info(
+                f"Экспорт #{job.id} завершен: {job.users_exported} пользователей, {job.rows_exported} строк, "
+                f"{job.bytes_written} байт за {stats['elapsed_seconds']} с ({stats['rows_per_second']} строк/с)"
+            )
+        except asyncio.CancelledError:
+            # Задача остается в статусе running и может быть продолжена через resume
+            logger.warning(f"Экспорт #{job_id} прерван на пользователе id {job.last_user_id}")
+            try:
+                async with AsyncSessionLocal() as release_db:
+                    await crud.release_export_job(release_db, job_id, _worker_id)
+            except Exception as e:
+                logger.warning(f"Не удалось снять захват экспорта #{job_id}: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка экспорта #{job_id}: {e}", exc_info=True)
+            await db.rollback()
+            job = await crud.get_export_job(db, job_id)
+            job.status = "failed"
+            job.claimed_by = None
+            job.error = str(e)
+            await db.commit()
+
+
+def is_job_active(job: ExportJob) -> bool:
+    """Задача выполняется каким-либо воркером и недавно подтверждала выполнение"""
+    if job.claimed_by is None or job.heartbeat_at is None:
+        return False
+    return job.heartbeat_at >= datetime.utcnow() - timedelta(seconds=EXPORT_JOB_STALE_SECONDS)
+
+
+async def start_export_job(job_id: int) -> bool:
+    """
+    Захватывает задачу экспорта в БД и запускает ее в фоне этого воркера.
+    Возвращает False, если задача уже выполняется (в том числе другим воркером)
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=EXPORT_JOB_STALE_SECONDS)
+    async with AsyncSessionLocal() as db:
+        if not await crud.claim_export_job(db, job_id, _worker_id, stale_before):
+            return False
+    task = asyncio.create_task(run_export_job(job_id))
+    _running_jobs[job_id] = task
+    task.add_done_callback(lambda _: _running_jobs.pop(job_id, None))
+    return True
+
+
+async def cancel_running_jobs():
+    """Останавливает фоновые задачи экспорта при завершении приложения"""
+    tasks = [task for task in _running_jobs.values() if not task.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,178 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from backend.config import settings
+from backend.services import metrics
+from backend.services.cache_sync import cache_sync
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCacheBackend:
+    """
+    LRU-кэш в памяти процесса: для каждого пользователя хранит словарь поле -> (срок жизни, значение).
+    При превышении max_users вытесняются пользователи, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, max_users: int):
+        self._max_users = max_users
+        self._entries: "OrderedDict[int, Dict[str, Tuple[float, Any]]]" = OrderedDict()
+
+    async def get(self, user_id: int, field: str) -> Optional[Any]:
+        fields = self._entries.get(user_id)
+        if fields is None:
+            return None
+        entry = fields.get(field)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del fields[field]
+            return None
+        self._entries.move_to_end(user_id)
+        return value
+
+    async def set(self, user_id: int, field: str, value: Any, ttl: int):
+        fields = self._entries.setdefault(user_id, {})
+        fields[field] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self._max_users:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    async def invalidate_all(self):
+        self._entries.clear()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class RedisCacheBackend:
+    """
+    Кэш в Redis (или совместимом хранилище): один hash на пользователя, значения хранятся в JSON.
+    Общий для всех процессов backend, поэтому сброс после записи виден всем воркерам.
+    """
+
+    def __init__(self, url: str, prefix: str = "antichaos:progress"):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+
+    def _key(self, user_id: int) -> str:
+        return f"{self._prefix}:{user_id}"
+
+    async def get(self, user_id: int, field: str) -> Optional[Any]:
+        data = await self._redis.hget(self._key(user_id), field)
+        return json.loads(data) if data is not None else None
+
+    async def set(self, user_id: int, field: str, value: Any, ttl: int):
+        key = self._key(user_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, field, json.dumps(value, ensure_ascii=False, default=_json_default))
+            pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def invalidate(self, user_id: int):
+        await self._redis.delete(self._key(user_id))
+
+    async def invalidate_all(self):
+        async for key in self._redis.scan_iter(match=f"{self._prefix}:*"):
+            await self._redis.delete(key)
+
+
+class ReportCache:
+    """
+    TTL-кэш отчетов о прогрессе с ключом (user_id, вид отчета, день).
+    Сбрасывается для пользователя при записи оценок, ответов и фокус-сфер (см. crud).
+    Попадания и промахи считаются в метриках progress_cache_hits_total / progress_cache_misses_total.
+    При нескольких воркерах сбросы кэша в памяти рассылаются остальным воркерам через cache_sync.
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = self._create_backend()
+        return self._backend
+
+    def _create_backend(self):
+        if settings.cache_backend == "redis" and settings.redis_url:
+            try:
+                backend = RedisCacheBackend(settings.redis_url)
+                logger.info("Кэш отчетов: Redis")
+                return backend
+            except ImportError:
+                logger.warning("Пакет redis не установлен, кэш отчетов будет храниться в памяти процесса")
+        return MemoryCacheBackend(settings.progress_cache_max_users)
+
+    async def get_or_compute(self, user_id: int, kind: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        await cache_sync.sync()
+        field = f"{kind}:{datetime.utcnow().date().isoformat()}"
+        try:
+            value = await self.backend.get(user_id, field)
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша отчетов: {e}")
+            value = None
+
+        if value is not None:
+            metrics.increment("progress_cache_hits_total")
+            return value
+
+        metrics.increment("progress_cache_misses_total")
+        value = await compute()
+        try:
+            await self.backend.set(user_id, field, value, settings.progress_cache_ttl)
+        except Exception as e:
+            logger.warning(f"Ошибка записи в кэш отчетов: {e}")
+        return value
+
+    async def invalidate(self, user_id: int, publish: bool = True):
+        await self.invalidate_many([user_id], publish)
+
+    async def invalidate_many(self, user_ids: Iterable[int], publish: bool = True):
+        """
+        Сбрасывает кэш нескольких пользователей (одной транзакцией в журнал сбросов для остальных воркеров).
+        publish=False - запись в журнал уже добавлена в транзакцию изменения через stage_invalidation.
+        """
+        user_ids = list(user_ids)
+        for user_id in user_ids:
+            await self._apply_invalidation(user_id)
+        if publish:
+            await self._publish(user_ids)
+
+    def stage_invalidation(self, db, user_ids: Iterable[int]):
+        """Добавляет сброс кэша пользователей в журнал в транзакции изменения (до ее коммита)"""
+        if isinstance(self.backend, MemoryCacheBackend):
+            cache_sync.stage(db, "reports", user_ids)
+
+    async def invalidate_all(self):
+        await self._apply_invalidation(None)
+        await self._publish([None])
+
+    async def _apply_invalidation(self, user_id: Optional[int]):
+        try:
+            if user_id is None:
+                await self.backend.invalidate_all()
+            else:
+                await self.backend.invalidate(user_id)
+        except Exception as e:
+            logger.warning(f"Ошибка сброса кэша отчетов: {e}")
+
+    async def _publish(self, user_ids: list):
+        # Redis общий для всех воркеров, рассылать нужно только сбросы кэша в памяти
+        if isinstance(self.backend, MemoryCacheBackend):
+            await cache_sync.publish("reports", user_ids)
+
+
+report_cache = ReportCache()
+cache_sync.register("reports", report_cache._apply_invalidation)
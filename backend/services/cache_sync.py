@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+from backend.config import settings
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранятся записи журнала сбросов (удаляются ночной задачей)
+CACHE_INVALIDATIONS_RETENTION_HOURS = 1
+
+
+class CacheSync:
+    """
+    Рассылка сбросов кэшей в памяти процесса между воркерами (WEB_CONCURRENCY > 1) через таблицу cache_invalidations.
+    Сбросивший кэш воркер добавляет запись в журнал, остальные перед чтением кэша догоняют журнал
+    не чаще раза в CACHE_SYNC_INTERVAL_MS и сбрасывают у себя тот же кэш. С одним воркером ничего не делает.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[Optional[int]], Awaitable[None]]] = {}
+        self._source = f"{socket.gethostname()}:{os.getpid()}"
+        self._last_id: Optional[int] = None
+        self._synced_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.web_concurrency > 1
+
+    def register(self, cache: str, handler: Callable[[Optional[int]], Awaitable[None]]):
+        """Обработчик сброса кэша в этом воркере: получает ключ (user_id) или None для всего кэша"""
+        self._handlers[cache] = handler
+
+    async def publish(self, cache: str, keys: Iterable[Optional[int]] = (None,)):
+        """Сообщает остальным воркерам о сбросе кэша (локальный кэш вызывающий сбрасывает сам)"""
+        keys = list(keys)
+        if not self.enabled or not keys:
+            return
+        from backend.database import crud
+        from backend.database.database import AsyncSessionLocal
+        try:
+            async with AsyncSessionLocal() as db:
+                await crud.add_cache_invalidations(db, cache, keys, self._source)
+            metrics.increment("cache_invalidations_published_total", len(keys))
+        except Exception as e:
+            logger.warning(f"Ошибка записи в журнал сбросов кэшей: {e}")
+
+    def stage(self, db, cache: str, keys: Iterable[Optional[int]]):
+        """
+        Добавляет записи о сбросе в журнал в транзакции вызывающего кода, без отдельного коммита
+        (для горячих путей записи: ответы и оценки)
+        """
+        keys = list(keys)
+        if not self.enabled or not keys:
+            return
+        from backend.database.models import CacheInvalidation
+        db.add_all([CacheInvalidation(cache=cache, key=key, source=self._source) for key in keys])
+        metrics.increment("cache_invalidations_published_total", len(keys))
+
+    async def sync(self):
+        """Применяет сбросы кэшей из других воркеров, если журнал давно не проверялся"""
+        if not self.enabled or time.monotonic() - self._synced_at < settings.cache_sync_interval_ms / 1000:
+            return
+        async with self._lock:
+            if time.monotonic() - self._synced_at < settings.cache_sync_interval_ms / 1000:
+                return
+            try:
+                await self._catch_up()
+            except Exception as e:
+                logger.warning(f"Ошибка чтения журнала сбросов кэшей: {e}")
+            self._synced_at = time.monotonic()
+
+    async def _catch_up(self):
+        from backend.database import crud
+        from backend.database.database import AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            if self._last_id is None:
+                # Кэши нового воркера еще пусты, прошлые сбросы применять не нужно
+                self._last_id = await crud.get_last_cache_invalidation_id(db)
+                return
+            while True:
+                rows = await crud.get_cache_invalidations(db, self._last_id)
+                if not rows:
+                    return
+                for _, cache, key, source in rows:
+                    handler = self._handlers.get(cache)
+                    if handler is not None and source != self._source:
+                        await handler(key)
+                        metrics.increment("cache_invalidations_applied_total")
+                self._last_id = rows[-1][0]
+
+
+cache_sync = CacheSync()
@@ -0,0 +1,230 @@
+import json
+import logging
+import numpy as np
+from array import array
+from datetime import datetime, date, timedelta
+from typing import AsyncIterator, Dict, List
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import crud
+from backend.database.models import CohortWeeklyStat
+
+logger = logging.getLogger(__name__)
+
+# Сколько недель считается пакетной задачей и отдается по умолчанию
+COHORT_WEEKS = 12
+
+
+def get_week_start(day: date) -> date:
+    """Понедельник недели, в которую попадает день"""
+    return day - timedelta(days=day.weekday())
+
+
+def compute_weekly_stats(
+    first_week: date,
+    weeks: int,
+    sphere_columns: tuple,
+    answer_columns: tuple,
+    signup_days: np.ndarray
+) -> List[dict]:
+    """
+    Метрики по неделям, начиная с first_week:
+    - средняя оценка и количество оценок по сферам (из колонок дневных агрегатов _load_sphere_columns)
+    - количество ответов и активных пользователей (из колонок _load_answer_columns)
+    - количество пользователей, зарегистрированных до конца недели (signup_days - ordinal дат регистрации)
+    """
+    start = first_week.toordinal()
+    spheres, sphere_days, sphere_codes, sphere_sums, sphere_counts = sphere_columns
+    sphere_count = len(spheres)
+    rating_sums = np.zeros((weeks, sphere_count))
+    rating_counts = np.zeros((weeks, sphere_count))
+    if len(sphere_days):
+        flat = (sphere_days - start) // 7 * sphere_count + sphere_codes
+        rating_sums = np.bincount(flat, weights=sphere_sums, minlength=weeks * sphere_count).reshape(weeks, sphere_count)
+        rating_counts = np.bincount(flat, weights=sphere_counts, minlength=weeks * sphere_count).reshape(weeks, sphere_count)
+
+    answers_count = np.zeros(weeks)
+    active_users = np.zeros(weeks, dtype=np.int64)
+    user_ids, answer_days, counts = answer_columns
+    if len(user_ids):
+        week_idx = (answer_days - start) // 7
+        answers_count = np.bincount(week_idx, weights=counts, minlength=weeks)
+        # Уникальные пары (неделя, пользователь)
+        stride = int(user_ids.max()) + 1
+        pairs = np.unique(week_idx * stride + user_ids)
+        active_users = np.bincount(pairs // stride, minlength=weeks)
+
+    week_ends = start + 7 * np.arange(1, weeks + 1)
+    users_total = np.searchsorted(np.sort(signup_days), week_ends, side="left")
+
+    ordered_spheres = sorted(enumerate(spheres), key=lambda item: item[1])
+    stats = []
+    for week in range(weeks):
+        averages = {
+            sphere: [round(float(rating_sums[week, i] / rating_counts[week, i]), 4), int(rating_counts[week, i])]
+            for i, sphere in ordered_spheres
+            if rating_counts[week, i] > 0
+        }
+        stats.append({
+            "week_start": first_week + timedelta(weeks=week),
+            "users_total": int(users_total[week]),
+            "active_users": int(active_users[week]),
+            "answers_count": int(answers_count[week]),
+            "sphere_averages": averages
+        })
+    return stats
+
+
+def compute_retention(first_week: date, weeks: int, answer_columns: tuple, signup_columns: tuple) -> List[dict]:
+    """
+    Удержание по неделям регистрации: для каждой недели регистрации начиная с first_week -
+    доля пользователей когорты, ответивших хотя бы на один вопрос через 0, 1, 2, ... недель после регистрации.
+    """
+    start = first_week.toordinal()
+    user_ids, signup_days = signup_columns
+    signup_weeks = (signup_days - start) // 7
+    in_range = (signup_weeks >= 0) & (signup_weeks < weeks)
+    user_ids, signup_weeks = user_ids[in_range], signup_weeks[in_range]
+    if not len(user_ids):
+        return []
+
+    order = np.argsort(user_ids)
+    user_ids, signup_weeks = user_ids[order], signup_weeks[order]
+    cohort_sizes = np.bincount(signup_weeks, minlength=weeks)
+    active = np.zeros((weeks, weeks), dtype=np.int64)
+
+    answer_users, answer_days, _ = answer_columns
+    if len(answer_users):
+        answer_weeks = (answer_days - start) // 7
+        # Находим неделю регистрации автора каждой строки ответов
+        positions = np.clip(np.searchsorted(user_ids, answer_users), 0, len(user_ids) - 1)
+        known = user_ids[positions] == answer_users
+        cohorts = signup_weeks[positions[known]]
+        offsets = answer_weeks[known] - cohorts
+        valid = (offsets >= 0) & (offsets < weeks)
+        # Каждого пользователя считаем один раз на неделю
+        pairs = np.unique(np.stack([answer_users[known][valid], cohorts[valid], offsets[valid]], axis=1), axis=0)
+        if len(pairs):
+            np.add.at(active, (pairs[:, 1], pairs[:, 2]), 1)
+
+    retention = []
+    for cohort in range(weeks):
+        if not cohort_sizes[cohort]:
+            continue
+        observed_weeks = weeks - cohort
+        retention.append({
+            "signup_week": first_week + timedelta(weeks=cohort),
+            "cohort_size": int(cohort_sizes[cohort]),
+            "retention": [round(float(active[cohort, k] / cohort_sizes[cohort]), 4) for k in range(observed_weeks)]
+        })
+    return retention
+
+
+# Колоночные выгрузки: строки потока сразу раскладываются по типизированным массивам и не накапливаются списком
+async def _load_sphere_columns(db: AsyncSession, start_day: date, end_day: date) -> tuple:
+    """Дневные агрегаты оценок всех пользователей за период: (сферы, ordinal дня, код сферы, сумма, количество)"""
+    codes: Dict[str, int] = {}
+    days, sphere_codes, sums, counts = array("q"), array("q"), array("d"), array("d")
+    async for day, sphere, rating_sum, rating_count in crud.stream_sphere_daily_rows(db, start_day, end_day):
+        days.append(day.toordinal())
+        sphere_codes.append(codes.setdefault(sphere, len(codes)))
+        sums.append(rating_sum)
+        counts.append(rating_count)
+    return (
+        list(codes), np.array(days, dtype=np.int64), np.array(sphere_codes, dtype=np.int64),
+        np.array(sums, dtype=np.float64), np.array(counts, dtype=np.float64)
+    )
+
+
+async def _load_answer_columns(db: AsyncSession, start_day: date, end_day: date) -> tuple:
+    """Дневное количество ответов всех пользователей за период: (user_id, ordinal дня, количество)"""
+    user_ids, days, counts = array("q"), array("q"), array("d")
+    async for user_id, day, answers_count in crud.stream_answer_daily_rows(db, start_day, end_day):
+        user_ids.append(user_id)
+        days.append(day.toordinal())
+        counts.append(answers_count)
+    return np.array(user_ids, dtype=np.int64), np.array(days, dtype=np.int64), np.array(counts, dtype=np.float64)
+
+
+async def _load_signup_columns(db: AsyncSession) -> tuple:
+    """Даты регистрации всех пользователей: (user_id, ordinal дня регистрации)"""
+    user_ids, days = array("q"), array("q")
+    async for user_id, created_at in crud.stream_user_signups(db):
+        if created_at:
+            user_ids.append(user_id)
+            days.append(created_at.date().toordinal())
+    return np.array(user_ids, dtype=np.int64), np.array(days, dtype=np.int64)
+
+
+def _stat_to_dict(stat: CohortWeeklyStat) -> dict:
+    return {
+        "week_start": stat.week_start,
+        "users_total": stat.users_total,
+        "active_users": stat.active_users,
+        "answers_count": stat.answers_count,
+        "sphere_averages": json.loads(stat.sphere_averages)
+    }
+
+
+async def refresh_cohort_stats(db: AsyncSession, weeks: int = COHORT_WEEKS) -> int:
+    """
+    Пакетно считает и сохраняет метрики завершенных недель, которых еще нет в cohort_weekly_stats.
+    Рассчитывается на дневных агрегатах, поэтому запускается после ночной агрегации.
+    Возвращает количество посчитанных недель.
+    """
+    current_week = get_week_start(datetime.utcnow().date())
+    first_week = current_week - timedelta(weeks=weeks)
+    saved = {stat.week_start for stat in await crud.get_cohort_weekly_stats(db, first_week, current_week)}
+    missing = [first_week + timedelta(weeks=i) for i in range(weeks) if first_week + timedelta(weeks=i) not in saved]
+    if not missing:
+        return 0
+
+    # Считаем одним проходом от первой недостающей недели до текущей
+    start_week = missing[0]
+    span = (current_week - start_week).days // 7
+    sphere_columns = await _load_sphere_columns(db, start_week, current_week)
+    answer_columns = await _load_answer_columns(db, start_week, current_week)
+    _, signup_days = await _load_signup_columns(db)
+    stats = compute_weekly_stats(start_week, span, sphere_columns, answer_columns, signup_days)
+    new_stats = [stat for stat in stats if stat["week_start"] not in saved]
+    for stat in new_stats:
+        stat["sphere_averages"] = json.dumps(stat["sphere_averages"])
+
+    try:
+        await crud.save_cohort_weekly_stats(db, new_stats)
+    except IntegrityError:
+        # Эти недели уже сохранены параллельным запуском
+        await db.rollback()
+    logger.info(f"Когортные метрики посчитаны для {len(new_stats)} нед.")
+    return len(new_stats)
+
+
+async def iter_cohort_report(db: AsyncSession, weeks: int = COHORT_WEEKS) -> AsyncIterator[dict]:
+    """
+    Когортный отчет по строкам: метрики завершенных недель (из cohort_weekly_stats),
+    метрики текущей недели (по дневным агрегатам), распределение фокус-сфер и удержание по неделям регистрации.
+    Агрегаты и метрики недель считает ночная задача (rollup_loop), запрос их только читает:
+    недели, удаленные после удаления пользователей, появятся после ее следующего запуска.
+    weeks не больше COHORT_WEEKS - старше ночная задача недели не считает.
+    """
+    today = datetime.utcnow().date()
+    current_week = get_week_start(today)
+    first_week = current_week - timedelta(weeks=weeks)
+
+    for stat in await crud.get_cohort_weekly_stats(db, first_week, current_week):
+        yield {"type": "week", "finished": True, **_stat_to_dict(stat)}
+
+    # Оценки нужны только за текущую неделю, ответы - за весь период (для удержания)
+    sphere_columns = await _load_sphere_columns(db, current_week, today)
+    answer_columns = await _load_answer_columns(db, first_week, today)
+    signup_columns = await _load_signup_columns(db)
+    current = answer_columns[1] >= current_week.toordinal()
+    current_answers = tuple(column[current] for column in answer_columns)
+    for stat in compute_weekly_stats(current_week, 1, sphere_columns, current_answers, signup_columns[1]):
+        yield {"type": "week", "finished": False, **stat}
+
+    for sphere, users in await crud.get_focus_sphere_distribution(db):
+        yield {"type": "focus_sphere", "sphere": sphere, "users": users}
+
+    for row in compute_retention(first_week, weeks + 1, answer_columns, signup_columns):
+        yield {"type": "retention", **row}
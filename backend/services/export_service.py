@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import crud
+from backend.database.models import User, UserSettings
+
+EXPORT_FORMATS = ("json", "ndjson", "csv")
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _user_dict(user: User) -> dict:
+    return {
+        "id": user.id,
+        "telegram_id": user.telegram_id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "name": user.name,
+        "gender": user.gender,
+        "birth_date": _isoformat(user.birth_date),
+        "created_at": _isoformat(user.created_at)
+    }
+
+
+def _settings_dict(settings: Optional[UserSettings]) -> dict:
+    return {
+        "notification_time": settings.notification_time if settings else None,
+        "language": settings.language if settings else None,
+        "is_paused": settings.is_paused if settings else None,
+        "weekly_report_frequency": settings.weekly_report_frequency if settings else None,
+        "reminder_frequency": settings.reminder_frequency if settings else None,
+        "dark_theme": settings.dark_theme if settings else None
+    }
+
+
+def _sphere_dict(row: dict) -> dict:
+    return {"sphere": row["sphere"], "rating": row["rating"], "date": _isoformat(row["date"])}
+
+
+def _answer_dict(row: dict) -> dict:
+    return {"question_id": row["question_id"], "answer": row["answer"], "date": _isoformat(row["date"])}
+
+
+async def _iter_json(db: AsyncSession, user: User) -> AsyncIterator[str]:
+    """JSON-документ в том же формате, что и раньше, но собранный по частям"""
+    yield '{"user": ' + _dumps(_user_dict(user)) + ', "spheres": ['
+    separator = ""
+    async for row in crud.stream_user_spheres(db, user.id):
+        yield separator + _dumps(_sphere_dict(row))
+        separator = ", "
+
+    yield '], "answers": ['
+    separator = ""
+    async for row in crud.stream_user_answers(db, user.id, ["question_id", "answer", "date"]):
+        yield separator + _dumps(_answer_dict(row))
+        separator = ", "
+
+    focus_spheres = await crud.get_user_focus_spheres(db, user.id)
+    settings = await crud.get_user_settings(db, user.id)
+    yield '], "focus_spheres": ' + _dumps([fs.sphere for fs in focus_spheres])
+    yield ', "settings": ' + _dumps(_settings_dict(settings)) + '}'
+
+
+async def _iter_ndjson(db: AsyncSession, user: User) -> AsyncIterator[str]:
+    """По одной JSON-записи на строку, тип записи в поле type"""
+    yield _dumps({"type": "user", **_user_dict(user)}) + "\n"
+    async for row in crud.stream_user_spheres(db, user.id):
+        yield _dumps({"type": "sphere", **_sphere_dict(row)}) + "\n"
+    async for row in crud.stream_user_answers(db, user.id, ["question_id", "answer", "date"]):
+        yield _dumps({"type": "answer", **_answer_dict(row)}) + "\n"
+    for fs in await crud.get_user_focus_spheres(db, user.id):
+        yield _dumps({"type": "focus_sphere", "sphere": fs.sphere}) + "\n"
+    settings = await crud.get_user_settings(db, user.id)
+    yield _dumps({"type": "settings", **_settings_dict(settings)}) + "\n"
+
+
+async def _iter_csv(db: AsyncSession, user: User) -> AsyncIterator[str]:
+    """Таблица оценок сфер и ответов: type, date, sphere, rating, question_id, answer"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(["type", "date", "sphere", "rating", "question_id", "answer"])
+    yield flush()
+    async for row in crud.stream_user_spheres(db, user.id):
+        writer.writerow(["sphere", _isoformat(row["date"]), row["sphere"], row["rating"], "", ""])
+        yield flush()
+    async for row in crud.stream_user_answers(db, user.id, ["question_id", "answer", "date"]):
+        writer.writerow(["answer", _isoformat(row["date"]), "", "", row["question_id"], row["answer"]])
+        yield flush()
+
+
+async def iter_user_export(
+    db: AsyncSession,
+    user: User,
+    export_format: str = "json",
+    compress: bool = False,
+    chunk_size: int = 64 * 1024
+) -> AsyncIterator[bytes]:
+    """
+    Построчно формирует экспорт данных пользователя в формате json, ndjson или csv.
+    Оценки и ответы читаются серверными курсорами, а вывод отдается блоками по chunk_size байт,
+    поэтому память не зависит от объема истории. При compress=True блоки сжимаются gzip.
+    """
+    if export_format == "ndjson":
+        parts = _iter_ndjson(db, user)
+    elif export_format == "csv":
+        parts = _iter_csv(db, user)
+    else:
+        parts = _iter_json(db, user)
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    pending = []
+    pending_size = 0
+
+    async for part in parts:
+        data = part.encode("utf-8")
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= chunk_size:
+            chunk = b"".join(pending)
+            pending, pending_size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b"".join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from backend.config import settings
+from backend.database import crud
+from backend.database.database import AsyncSessionLocal
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Пауза между пачками, чтобы запросы пользователей успевали получить блокировку записи SQLite
+GUEST_GC_PAUSE_SECONDS = 0.05
+
+
+async def run_guest_gc(ttl_days: Optional[int] = None, batch_size: Optional[int] = None) -> Dict:
+    """
+    Удаляет неактивных гостей (созданных раньше ttl_days дней назад и без ответов и оценок за этот срок)
+    пачками по batch_size пользователей: каждая пачка - отдельная короткая транзакция.
+    Возвращает отчет: количество удаленных гостей и строк по таблицам.
+    """
+    ttl_days = settings.guest_ttl_days if ttl_days is None else ttl_days
+    batch_size = batch_size or settings.guest_gc_batch_size
+    report = {"users_deleted": 0, "rows_deleted": 0, "tables": {}}
+    if ttl_days <= 0:
+        return report
+
+    cutoff = datetime.utcnow() - timedelta(days=ttl_days)
+    tables = Counter()
+    last_user_id = 0
+
+    async with AsyncSessionLocal() as db:
+        while True:
+            user_ids = await crud.get_inactive_guest_ids(db, cutoff, last_user_id, batch_size)
+            if not user_ids:
+                break
+            deleted = await crud.delete_users_bulk(db, user_ids)
+            tables.update(deleted)
+            report["users_deleted"] += deleted.get("users", 0)
+            last_user_id = user_ids[-1]
+            await asyncio.sleep(GUEST_GC_PAUSE_SECONDS)
+
+    report["tables"] = dict(tables)
+    report["rows_deleted"] = sum(tables.values())
+    metrics.increment("guest_gc_users_deleted_total", report["users_deleted"])
+    metrics.increment("guest_gc_rows_deleted_total", report["rows_deleted"])
+    logger.info(f"Удалено неактивных гостей: {report['users_deleted']}, строк: {report['rows_deleted']}")
+    return report
@@ -0,0 +1,22 @@
+from collections import defaultdict
+from typing import Dict
+
+# Счетчики процесса (имя метрики -> значение), отдаются в формате Prometheus через /metrics
+_counters: Dict[str, int] = defaultdict(int)
+
+
+def increment(name: str, value: int = 1):
+    _counters[name] += value
+
+
+def get_counters() -> Dict[str, int]:
+    return dict(_counters)
+
+
+def render_prometheus() -> str:
+    """Текстовый формат Prometheus: по одной строке на счетчик"""
+    lines = []
+    for name, value in sorted(_counters.items()):
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,58 +1,124 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Dict
-from datetime import datetime, timedelta
+from typing import Dict
+from datetime import datetime, timedelta, time
 from backend.database import crud
-from backend.database.models import UserSphere
+from backend.services.rollup_service import rollup_user
+from backend.services.cache import report_cache
 
 
-async def calculate_progress(db: AsyncSession, user_id: int, days: int = 7) -> Dict:
-    """
-    Рассчитывает прогресс пользователя за указанное количество дней
-    """
-    # Получаем оценки сфер за период
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    # Получаем все оценки за период
-    all_spheres = await crud.get_user_spheres(db, user_id)
-    period_spheres = [s for s in all_spheres if s.date >= start_date]
-    
-    # Группируем по сферам
-    spheres_data = {}
-    for sphere in period_spheres:
-        if sphere.sphere not in spheres_data:
-            spheres_data[sphere.sphere] = []
-        spheres_data[sphere.sphere].append({
-            'rating': sphere.rating,
-            'date': sphere.date
-        })
-    
-    # Рассчитываем средние значения
-    average_ratings = {}
-    for sphere_name, ratings in spheres_data.items():
-        if ratings:
-            average_ratings[sphere_name] = sum(r['rating'] for r in ratings) / len(ratings)
-    
-    # Получаем последние оценки для сравнения
-    latest_spheres = await crud.get_latest_user_spheres(db, user_id)
-    latest_ratings = {s.sphere: s.rating for s in latest_spheres}
-    
-    # Определяем выросшие и просевшие сферы
+def _latest_ratings(snapshot: Dict) -> Dict[str, int]:
+    """Последние оценки по сферам из снимка (от новых к старым, как get_latest_user_spheres)"""
+    latest = sorted(snapshot['latest_ratings'].items(), key=lambda item: (item[1][0], item[1][1]), reverse=True)
+    return {sphere: entry[2] for sphere, entry in latest}
+
+
+def _count_answers_since(snapshot: Dict, days: int) -> int:
+    start = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    return sum(1 for date in snapshot['recent_answers'] if date >= start)
+
+
+def _compare_ratings(current_ratings: Dict[str, float], previous_ratings: Dict[str, float]):
+    """Определяет выросшие и просевшие сферы относительно предыдущих оценок"""
     grown_spheres = []
     declined_spheres = []
     
-    for sphere_name, current_rating in latest_ratings.items():
-        if sphere_name in average_ratings:
-            previous_avg = average_ratings[sphere_name]
-            if current_rating > previous_avg:
+    for sphere_name, current_rating in current_ratings.items():
+        if sphere_name in previous_ratings:
+            previous = previous_ratings[sphere_name]
+            if current_rating > previous:
                 grown_spheres.append({
                     'sphere': sphere_name,
-                    'growth': current_rating - previous_avg
+                    'growth': current_rating - previous
                 })
-            elif current_rating < previous_avg:
+            elif current_rating < previous:
                 declined_spheres.append({
                     'sphere': sphere_name,
-                    'decline': previous_avg - current_rating
+                    'decline': previous - current_rating
                 })
+    return grown_spheres, declined_spheres
+
+
+async def calculate_progress(db: AsyncSession, user_id: int, days: int = 7) -> Dict:
+    """
+    Прогресс пользователя за указанное количество дней (из кэша отчетов, если он еще актуален)
+    """
+    return await report_cache.get_or_compute(user_id, f"progress:{days}", lambda: _calculate_progress(db, user_id, days))
+
+
+async def _calculate_progress(db: AsyncSession, user_id: int, days: int) -> Dict:
+    """
+    Рассчитывает прогресс пользователя за указанное количество дней.
+    Для периодов до PROGRESS_SNAPSHOT_DAYS дней данные берутся из снимка прогресса (одна строка),
+    для более длинных - из дневных агрегатов.
+    """
+    if days > crud.PROGRESS_SNAPSHOT_DAYS:
+        return await _calculate_progress_from_rollups(db, user_id, days)
+    
+    snapshot = await crud.get_progress_snapshot(db, user_id)
+    return _progress_from_snapshot(snapshot, days)
+
+
+def _progress_from_snapshot(snapshot: Dict, days: int) -> Dict:
+    """Прогресс за days дней по снимку: средние оценки за период и сравнение с последними оценками"""
+    start = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    
+    # Средние оценки за период (оценки в снимке идут по возрастанию даты)
+    totals = {}
+    for date, _, sphere, rating in reversed(snapshot['recent_ratings']):
+        if date >= start:
+            total = totals.setdefault(sphere, [0, 0])
+            total[0] += rating
+            total[1] += 1
+    average_ratings = {sphere: total / count for sphere, (total, count) in totals.items()}
+    
+    latest_ratings = _latest_ratings(snapshot)
+    grown_spheres, declined_spheres = _compare_ratings(latest_ratings, average_ratings)
+    
+    return {
+        'current_ratings': latest_ratings,
+        'average_ratings': average_ratings,
+        'grown_spheres': grown_spheres,
+        'declined_spheres': declined_spheres,
+        'period_days': days
+    }
+
+
+async def _calculate_progress_from_rollups(db: AsyncSession, user_id: int, days: int) -> Dict:
+    """
+    Рассчитывает прогресс за длинный период: завершенные дни берутся из дневных агрегатов,
+    а неполные дни (первый день периода и сегодня) - из исходных оценок.
+    """
+    now = datetime.utcnow()
+    start_date = now - timedelta(days=days)
+    today = now.date()
+    first_full_day = start_date.date() + timedelta(days=1)
+    
+    # Догоняем агрегаты, если ночная агрегация еще не успела обработать пользователя
+    await rollup_user(db, user_id, today)
+    
+    totals = {}
+    for sphere, rating_sum, rating_count, last_rating_at in await crud.get_sphere_daily_totals(
+        db, user_id, first_full_day, today
+    ):
+        totals[sphere] = [rating_sum, rating_count, last_rating_at]
+    
+    edge_ratings = await crud.get_user_ratings_between(
+        db, user_id, start_date, datetime.combine(first_full_day, time.min)
+    )
+    edge_ratings += await crud.get_user_ratings_between(db, user_id, datetime.combine(today, time.min))
+    for _, sphere, rating, rated_at in edge_ratings:
+        total = totals.setdefault(sphere, [0, 0, rated_at])
+        total[0] += rating
+        total[1] += 1
+        total[2] = max(total[2], rated_at)
+    
+    # Средние оценки за период, сферы с более свежими оценками первыми
+    ordered = sorted(totals.items(), key=lambda item: item[1][2], reverse=True)
+    average_ratings = {sphere: total / count for sphere, (total, count, _) in ordered}
+    
+    snapshot = await crud.get_progress_snapshot(db, user_id)
+    latest_ratings = _latest_ratings(snapshot)
+    grown_spheres, declined_spheres = _compare_ratings(latest_ratings, average_ratings)
     
     return {
         'current_ratings': latest_ratings,
@@ -65,21 +131,39 @@ async def calculate_progress(db: AsyncSession, user_id: int, days: int = 7) -> D
 
 async def get_weekly_summary(db: AsyncSession, user_id: int) -> Dict:
     """
-    Получает итоги недели
+    Получает итоги недели (из кэша отчетов, если он еще актуален)
     """
-    progress = await calculate_progress(db, user_id, days=7)
+    return await report_cache.get_or_compute(user_id, "weekly", lambda: _build_weekly_summary(db, user_id))
+
+
+def _streak_to_dict(streak) -> Dict:
+    """Серия ответов пользователя; текущая серия обнуляется, если вчера и сегодня ответов не было"""
+    if streak is None:
+        return {'current': 0, 'longest': 0, 'last_answer_day': None, 'total_answers': 0}
+    current = streak.current_streak
+    if streak.last_answer_day < datetime.utcnow().date() - timedelta(days=1):
+        current = 0
+    return {
+        'current': current,
+        'longest': streak.longest_streak,
+        'last_answer_day': streak.last_answer_day,
+        'total_answers': streak.total_answers
+    }
+
+
+async def _build_weekly_summary(db: AsyncSession, user_id: int) -> Dict:
+    snapshot = await crud.get_progress_snapshot(db, user_id)
+    progress = _progress_from_snapshot(snapshot, 7)
     
     # Получаем фокус-сферы
     focus_spheres = await crud.get_user_focus_spheres(db, user_id)
     focus_sphere_names = [fs.sphere for fs in focus_spheres]
     
-    # Получаем количество ответов за неделю
-    answers = await crud.get_user_answers(db, user_id, days=7)
-    
     return {
         'progress': progress,
         'focus_spheres': focus_sphere_names,
-        'answers_count': len(answers),
+        'answers_count': _count_answers_since(snapshot, 7),
+        'streak': _streak_to_dict(await crud.get_user_streak(db, user_id)),
         'week_start': (datetime.utcnow() - timedelta(days=7)).date(),
         'week_end': datetime.utcnow().date()
     }
@@ -87,50 +171,24 @@ async def get_weekly_summary(db: AsyncSession, user_id: int) -> Dict:
 
 async def get_monthly_report(db: AsyncSession, user_id: int) -> Dict:
     """
-    Получает месячный отчёт
+    Получает месячный отчёт (из кэша отчетов, если он еще актуален)
     """
+    return await report_cache.get_or_compute(user_id, "monthly", lambda: _build_monthly_report(db, user_id))
+
+
+async def _build_monthly_report(db: AsyncSession, user_id: int) -> Dict:
+    snapshot = await crud.get_progress_snapshot(db, user_id)
+    
     # Получаем фокус-сферы
     focus_spheres = await crud.get_user_focus_spheres(db, user_id)
     focus_sphere_names = [fs.sphere for fs in focus_spheres]
     
-    # Получаем количество ответов за месяц
-    answers = await crud.get_user_answers(db, user_id, days=30)
-    
-    # Получаем начальные оценки (30 дней назад)
-    start_date = datetime.utcnow() - timedelta(days=30)
-    all_spheres = await crud.get_user_spheres(db, user_id)
-    initial_spheres = [s for s in all_spheres if s.date < start_date]
-    
-    initial_ratings = {}
-    if initial_spheres:
-        # Берем последние оценки до начала периода
-        latest_before_period = {}
-        for sphere in initial_spheres:
-            if sphere.sphere not in latest_before_period or sphere.date > latest_before_period[sphere.sphere].date:
-                latest_before_period[sphere.sphere] = sphere
-        initial_ratings = {s.sphere: s.rating for s in latest_before_period.values()}
-    
-    # Получаем текущие оценки
-    latest_spheres = await crud.get_latest_user_spheres(db, user_id)
-    current_ratings = {s.sphere: s.rating for s in latest_spheres}
+    # Начальные оценки - последние оценки до начала периода (30 дней назад)
+    initial_ratings = {sphere: entry[2] for sphere, entry in snapshot['baseline_ratings'].items()}
+    current_ratings = _latest_ratings(snapshot)
     
     # Определяем выросшие и просевшие сферы на основе сравнения начальных и текущих оценок
-    grown_spheres = []
-    declined_spheres = []
-    
-    for sphere_name, current_rating in current_ratings.items():
-        if sphere_name in initial_ratings:
-            initial_rating = initial_ratings[sphere_name]
-            if current_rating > initial_rating:
-                grown_spheres.append({
-                    'sphere': sphere_name,
-                    'growth': current_rating - initial_rating
-                })
-            elif current_rating < initial_rating:
-                declined_spheres.append({
-                    'sphere': sphere_name,
-                    'decline': initial_rating - current_rating
-                })
+    grown_spheres, declined_spheres = _compare_ratings(current_ratings, initial_ratings)
     
     # Создаем объект progress с правильными данными для месячного отчета
     progress = {
@@ -143,10 +201,9 @@ async def get_monthly_report(db: AsyncSession, user_id: int) -> Dict:
     return {
         'progress': progress,
         'focus_spheres': focus_sphere_names,
-        'answers_count': len(answers),
+        'answers_count': _count_answers_since(snapshot, 30),
         'initial_ratings': initial_ratings,
         'current_ratings': current_ratings,
         'month_start': (datetime.utcnow() - timedelta(days=30)).date(),
         'month_end': datetime.utcnow().date()
     }
-
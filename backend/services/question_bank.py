@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from array import array
+from typing import Dict, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import crud
+from backend.database.models import Question
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionBank:
+    """
+    Банк активных вопросов в памяти процесса.
+    Для каждой сферы хранит компактный массив ID активных вопросов,
+    а для каждого вопроса - сферу, текст и тип для формирования ответа API.
+    Загружается при первом обращении и сбрасывается после изменений в админке (см. invalidate).
+    """
+
+    def __init__(self):
+        # (ID активных вопросов по сферам, вопрос -> (сфера, текст, тип)) - заменяются только вместе
+        self._data: Optional[Tuple[Dict[str, array], Dict[int, Tuple[str, str, str]]]] = None
+        self._version = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """Сбрасывает банк, чтобы при следующем обращении он был загружен заново"""
+        self._version += 1
+        self._data = None
+
+    async def _load(self, db: AsyncSession) -> Tuple[Dict[str, array], Dict[int, Tuple[str, str, str]]]:
+        """Возвращает согласованную пару (ID по сферам, данные вопросов) из одной загрузки"""
+        data = self._data
+        if data is not None:
+            return data
+
+        async with self._lock:
+            if self._data is not None:
+                return self._data
+
+            version = self._version
+            rows = await crud.get_active_question_rows(db)
+            by_sphere = {}
+            questions = {}
+            for question_id, sphere, text, question_type in rows:
+                by_sphere.setdefault(sphere, array("l")).append(question_id)
+                questions[question_id] = (sphere, text, question_type)
+
+            # Если во время загрузки вопросы изменились, не сохраняем устаревшие данные
+            if version == self._version:
+                self._data = (by_sphere, questions)
+                logger.info(f"Банк вопросов загружен: {len(questions)} активных вопросов, {len(by_sphere)} сфер")
+            return by_sphere, questions
+
+    async def get_sphere(self, db: AsyncSession, sphere: str) -> Tuple[array, Dict[int, Tuple[str, str, str]]]:
+        """
+        Возвращает ID активных вопросов сферы и данные всех активных вопросов из одной загрузки банка,
+        чтобы выбранный ID гарантированно был найден в данных (см. build_question)
+        """
+        by_sphere, questions = await self._load(db)
+        return by_sphere.get(sphere, array("l")), questions
+
+    @staticmethod
+    def build_question(questions: Dict[int, Tuple[str, str, str]], question_id: int) -> Optional[Question]:
+        """Вопрос из данных банка; объект не привязан к сессии и используется только для чтения"""
+        data = questions.get(question_id)
+        if data is None:
+            return None
+        sphere, text, question_type = data
+        return Question(id=question_id, sphere=sphere, text=text, type=question_type, is_active=True)
+
+
+question_bank = QuestionBank()
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import crud
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledSchedule:
+    """
+    Расписание вопросов, собранное в памяти: день -> сфера -> список ID вопросов.
+    Загружается из таблицы question_schedule один раз при первом обращении
+    и перестраивается после изменений в админке (см. invalidate).
+    """
+
+    def __init__(self):
+        self._days: Optional[Dict[int, Dict[str, List[int]]]] = None
+        self._version = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """Сбрасывает расписание, чтобы при следующем обращении оно было загружено заново"""
+        self._version += 1
+        self._days = None
+
+    async def _load(self, db: AsyncSession) -> Dict[int, Dict[str, List[int]]]:
+        days = self._days
+        if days is not None:
+            return days
+
+        async with self._lock:
+            if self._days is not None:
+                return self._days
+
+            version = self._version
+            rows = await crud.get_active_schedule_rows(db)
+            days = {}
+            for day_number, sphere, question_id in rows:
+                days.setdefault(day_number, {}).setdefault(sphere, []).append(question_id)
+
+            # Если во время загрузки расписание изменилось, не сохраняем устаревшие данные
+            if version == self._version:
+                self._days = days
+                logger.info(f"Расписание вопросов загружено: {len(days)} дн., {len(rows)} записей")
+            return days
+
+    async def get_question_ids(self, db: AsyncSession, day_number: int, sphere: str) -> List[int]:
+        """Возвращает ID активных вопросов расписания для дня и сферы"""
+        days = await self._load(db)
+        return days.get(day_number, {}).get(sphere, [])
+
+
+compiled_schedule = CompiledSchedule()
@@ -1,8 +1,55 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
-from datetime import datetime
+import random
 from backend.database import crud
-from backend.database.models import Question, UserFocusSphere
+from backend.database.models import Question
+from backend.services.question_schedule import compiled_schedule
+from backend.services.question_bank import question_bank
+from backend.services.cache_sync import cache_sync
+
+
+async def invalidate_question_caches():
+    """Сбрасывает банк вопросов и расписание в памяти после изменений в админке (во всех воркерах)"""
+    await _invalidate_local_question_caches()
+    await cache_sync.publish("questions")
+
+
+async def _invalidate_local_question_caches(key: Optional[int] = None):
+    question_bank.invalidate()
+    compiled_schedule.invalidate()
+
+
+cache_sync.register("questions", _invalidate_local_question_caches)
+
+
+async def get_question_for_sphere(
+    db: AsyncSession,
+    user_id: int,
+    sphere: str,
+    day_number: int
+) -> Optional[Question]:
+    """
+    Получает вопрос по сфере: сначала из расписания на текущий день пользователя,
+    если в расписании нет неотвеченных вопросов - случайный неотвеченный вопрос сферы из банка вопросов.
+    Отвеченные с момента выбора фокус-сфер вопросы определяются по битовой карте пользователя.
+    """
+    answered = await crud.get_answered_bitmap(db, user_id)
+    
+    await cache_sync.sync()
+    scheduled_ids = await compiled_schedule.get_question_ids(db, day_number, sphere)
+    # ID и данные вопросов берутся из одной загрузки банка
+    active_ids, questions = await question_bank.get_sphere(db, sphere)
+    unanswered_ids = [
+        question_id for question_id in scheduled_ids
+        if question_id in questions and not (answered >> question_id) & 1
+    ]
+    if not unanswered_ids:
+        unanswered_ids = [question_id for question_id in active_ids if not (answered >> question_id) & 1]
+    
+    if unanswered_ids:
+        return question_bank.build_question(questions, random.choice(unanswered_ids))
+    
+    return None
 
 
 async def get_daily_question_for_user(db: AsyncSession, user_id: int, current_sphere: Optional[str] = None) -> Optional[Question]:
@@ -25,34 +72,30 @@ async def get_daily_question_for_user(db: AsyncSession, user_id: int, current_sp
         # Если нет фокус-сфер, используем fallback
         return await get_simple_question_for_user(db, user_id)
     
-    # Определяем дату последнего изменения фокус-сфер (минимальная selected_at)
-    min_selected_at = min(fs.selected_at for fs in focus_spheres)
-    
-    # TODO: Реализовать логику работы с расписанием вопросов
-    # Пока используем текущую логику с рандомным выбором
-    # Когда расписание будет заполнено, здесь будет выбор из расписания
+    # Текущий день расписания пользователя
+    day_number = await crud.get_user_schedule_day(db, user_id)
     
     # Если указана текущая сфера, используем её
     if current_sphere:
         # Проверяем, что текущая сфера является одной из фокус-сфер
         sphere_keys = [fs.sphere for fs in focus_spheres]
         if current_sphere in sphere_keys:
-            question = await crud.get_random_question_by_sphere(
-                db, 
-                current_sphere, 
+            question = await get_question_for_sphere(
+                db,
                 user_id,
-                since_date=min_selected_at
+                current_sphere,
+                day_number
             )
             if question:
                 return question
     
     # Если выбрана 1 сфера - вопросы только из этой сферы
     if len(focus_spheres) == 1:
-        question = await crud.get_random_question_by_sphere(
-            db, 
-            focus_spheres[0].sphere, 
+        question = await get_question_for_sphere(
+            db,
             user_id,
-            since_date=min_selected_at
+            focus_spheres[0].sphere,
+            day_number
         )
         if question:
             return question
@@ -69,22 +112,22 @@ async def get_daily_question_for_user(db: AsyncSession, user_id: int, current_sp
                     break
         
         # Пробуем получить вопрос из текущей сферы
-        question = await crud.get_random_question_by_sphere(
-            db, 
-            focus_spheres[target_sphere_index].sphere, 
+        question = await get_question_for_sphere(
+            db,
             user_id,
-            since_date=min_selected_at
+            focus_spheres[target_sphere_index].sphere,
+            day_number
         )
         if question:
             return question
         
         # Если вопросов из текущей сферы нет, пробуем вторую сферу (если это была первая)
         if target_sphere_index == 0 and len(focus_spheres) >= 2:
-            question = await crud.get_random_question_by_sphere(
-                db, 
-                focus_spheres[1].sphere, 
+            question = await get_question_for_sphere(
+                db,
                 user_id,
-                since_date=min_selected_at
+                focus_spheres[1].sphere,
+                day_number
             )
             if question:
                 return question
@@ -108,20 +151,7 @@ async def get_spheres_for_rating_after_questions(db: AsyncSession, user_id: int)
 async def get_simple_question_for_user(db: AsyncSession, user_id: int) -> Optional[Question]:
     """
     Получает упрощенный вопрос для пользователя.
-    Используется когда у пользователя нет фокус-сфер.
-    Проверяет только ответы за сегодня.
+    Используется когда у пользователя нет фокус-сфер или вопросы по фокус-сферам закончились.
+    Выбирает случайный активный вопрос из любой сферы каталога, на который пользователь не отвечал сегодня.
     """
-    # Получаем все активные вопросы
-    all_spheres = ["health", "relationships", "money", "energy", "career", "other"]
-    
-    import random
-    random.shuffle(all_spheres)
-    
-    # Для простых вопросов проверяем только ответы за сегодня (since_date=None)
-    for sphere in all_spheres:
-        question = await crud.get_random_question_by_sphere(db, sphere, user_id, since_date=None)
-        if question:
-            return question
-    
-    return None
-
+    return await crud.get_random_unanswered_question(db, user_id, since_date=None)
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, date
+from typing import Dict, List, Optional, Set, Tuple
+from backend.config import settings
+from backend.database import crud
+from backend.database.database import AsyncSessionLocal
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionStatsCollector:
+    """
+    Счетчики показов и ответов на вопросы в памяти процесса. Пути выдачи вопроса и сохранения ответа
+    только увеличивают счетчики, а фоновая задача раз в QUESTION_STATS_FLUSH_SECONDS прибавляет их
+    к таблице question_stats одним запросом. Повторный показ того же вопроса пользователю в тот же день
+    не считается (страница вопроса может запрашиваться несколько раз). При нескольких воркерах (WEB_CONCURRENCY > 1)
+    показы сверяются с таблицей question_served_days в той же транзакции, поэтому вопрос, показанный
+    пользователю разными воркерами, тоже считается один раз.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, dict] = defaultdict(lambda: {
+            "times_served": 0, "times_answered": 0, "last_served_at": None, "last_answered_at": None
+        })
+        self._served_day: Optional[date] = None
+        self._served_today: Set[Tuple[int, int]] = set()
+        # Показы (day, user_id, question_id) для сверки с другими воркерами
+        self._served: List[Tuple[date, int, int]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def record_served(self, user_id: int, question_id: int):
+        now = datetime.utcnow()
+        if self._served_day != now.date():
+            self._served_day = now.date()
+            self._served_today.clear()
+        if (user_id, question_id) in self._served_today:
+            return
+        self._served_today.add((user_id, question_id))
+        entry = self._pending[question_id]
+        if settings.web_concurrency > 1:
+            self._served.append((now.date(), user_id, question_id))
+        else:
+            entry["times_served"] += 1
+        entry["last_served_at"] = now
+
+    def record_answered(self, question_id: int):
+        entry = self._pending[question_id]
+        entry["times_answered"] += 1
+        entry["last_answered_at"] = datetime.utcnow()
+
+    async def flush(self) -> int:
+        """Записывает накопленные счетчики; при ошибке возвращает их в очередь. Возвращает число вопросов"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, defaultdict(self._pending.default_factory)
+        served, self._served = self._served, []
+        stats = [{"question_id": question_id, **entry} for question_id, entry in pending.items()]
+        try:
+            async with AsyncSessionLocal() as db:
+                # Показы считаются только впервые записанные за день (в той же транзакции, что и счетчики)
+                new_served = await crud.add_question_served_days(db, served) if served else {}
+                await crud.add_question_stats(db, [
+                    {**row, "times_served": row["times_served"] + new_served.get(row["question_id"], 0)}
+                    for row in stats
+                ])
+        except Exception:
+            self._served.extend(served)
+            for row in stats:
+                entry = self._pending[row["question_id"]]
+                entry["times_served"] += row["times_served"]
+                entry["times_answered"] += row["times_answered"]
+                entry["last_served_at"] = max(filter(None, (entry["last_served_at"], row["last_served_at"])), default=None)
+                entry["last_answered_at"] = max(filter(None, (entry["last_answered_at"], row["last_answered_at"])), default=None)
+            metrics.increment("question_stats_flush_errors_total")
+            raise
+        metrics.increment("question_stats_flushed_total", len(stats))
+        return len(stats)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.question_stats_flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи статистики вопросов: {e}", exc_info=True)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую запись и записывает оставшиеся счетчики"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Ошибка записи статистики вопросов: {e}", exc_info=True)
+
+
+question_stats = QuestionStatsCollector()
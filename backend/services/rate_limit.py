@@ -0,0 +1,126 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+from backend.config import settings
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Максимум ключей (IP) в памяти; дольше всего не использовавшиеся вытесняются
+MAX_MEMORY_KEYS = 100000
+
+
+class MemoryRateLimitBackend:
+    """Token bucket в памяти процесса: для каждого ключа хранит (токены, время последнего пополнения)"""
+
+    def __init__(self, max_keys: int = MAX_MEMORY_KEYS):
+        self._max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated_at) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+# Атомарное пополнение и списание токена в Redis; возвращает время ожидания в миллисекундах (0 - разрешено)
+_REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return wait
+"""
+
+
+class RedisRateLimitBackend:
+    """Token bucket в Redis: общий для всех процессов backend, один hash на ключ"""
+
+    def __init__(self, url: str, prefix: str = "antichaos:ratelimit"):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_TOKEN_BUCKET)
+        self._prefix = prefix
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        wait_ms = await self._script(keys=[f"{self._prefix}:{key}"], args=[rate, burst, time.time()])
+        return int(wait_ms) / 1000
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов (token bucket) для именованного действия.
+    Лимиты задаются парами (токенов в секунду, размер пачки) на один ключ и на все ключи вместе.
+    При ошибке хранилища запрос пропускается. Отклоненные запросы считаются в метрике {name}_rejected_total.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = self._create_backend()
+        return self._backend
+
+    def _create_backend(self):
+        if settings.rate_limit_backend == "redis" and settings.redis_url:
+            try:
+                backend = RedisRateLimitBackend(settings.redis_url)
+                logger.info(f"Лимит {self.name}: Redis")
+                return backend
+            except ImportError:
+                logger.warning("Пакет redis не установлен, лимиты запросов будут храниться в памяти процесса")
+        return MemoryRateLimitBackend()
+
+    async def acquire(self, key: str, limits: Dict[str, Tuple[float, int]]) -> float:
+        """
+        Списывает по токену из бакета ключа и из общего бакета действия.
+        limits - {"key": (rate, burst), "global": (rate, burst)}.
+        Возвращает 0, если запрос разрешен, иначе рекомендуемое время ожидания в секундах.
+        """
+        buckets = [(f"{self.name}:ip:{key}", limits["key"]), (f"{self.name}:global", limits["global"])]
+        for bucket_key, (rate, burst) in buckets:
+            try:
+                retry_after = await self.backend.acquire(bucket_key, rate, burst)
+            except Exception as e:
+                logger.warning(f"Ошибка хранилища лимитов {self.name}: {e}")
+                retry_after = 0.0
+            if retry_after > 0:
+                metrics.increment(f"{self.name}_rejected_total")
+                return retry_after
+        return 0.0
+
+
+guest_creation_limiter = RateLimiter("guest_creation")
+
+
+async def check_guest_creation(ip_address: str) -> float:
+    """Лимит на создание гостевых пользователей по IP адресу; возвращает время ожидания в секундах (0 - можно создавать)"""
+    return await guest_creation_limiter.acquire(ip_address, {
+        "key": (settings.guest_rate_limit_per_minute / 60, settings.guest_rate_limit_burst),
+        "global": (settings.guest_rate_limit_global_per_minute / 60, settings.guest_rate_limit_global_burst)
+    })
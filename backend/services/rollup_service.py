@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from datetime import datetime, date, time, timedelta
+from typing import List, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import crud
+from backend.database.database import AsyncSessionLocal
+from backend.database.locks import acquire_leader
+
+logger = logging.getLogger(__name__)
+
+# Количество пользователей, обрабатываемых за один запрос в ночной агрегации
+ROLLUP_BATCH_USERS = 500
+
+# Как часто воркер, не ставший ведущим, повторяет попытку (секунды)
+LEADER_RETRY_SECONDS = 30
+
+# Фоновая задача ночной агрегации
+_rollup_task: Optional[asyncio.Task] = None
+
+
+def _aggregate_ratings(rows: List[tuple]) -> List[dict]:
+    """Группирует оценки (id, sphere, rating, date) по дню и сфере; строки идут по возрастанию даты"""
+    groups = {}
+    for _, sphere, rating, rated_at in rows:
+        key = (rated_at.date(), sphere)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = {
+                "day": key[0],
+                "sphere": sphere,
+                "rating_sum": rating,
+                "rating_count": 1,
+                "last_rating": rating,
+                "last_rating_at": rated_at
+            }
+        else:
+            group["rating_sum"] += rating
+            group["rating_count"] += 1
+            group["last_rating"] = rating
+            group["last_rating_at"] = rated_at
+    return list(groups.values())
+
+
+def _aggregate_answers(dates: List[datetime]) -> List[dict]:
+    counts = {}
+    for answered_at in dates:
+        day = answered_at.date()
+        counts[day] = counts.get(day, 0) + 1
+    return [{"day": day, "answers_count": count} for day, count in counts.items()]
+
+
+async def rollup_user(db: AsyncSession, user_id: int, today: Optional[date] = None) -> bool:
+    """
+    Агрегирует завершенные дни пользователя (до today, не включая), которые еще не попали в дневные таблицы.
+    Возвращает True, если граница агрегации была сдвинута.
+    """
+    today = today or datetime.utcnow().date()
+    watermark = await crud.get_rollup_watermark(db, user_id)
+    if watermark is not None and watermark >= today:
+        return False
+
+    start = datetime.combine(watermark, time.min) if watermark else None
+    end = datetime.combine(today, time.min)
+    ratings = await crud.get_user_ratings_between(db, user_id, start, end)
+    answer_dates = await crud.get_user_answer_dates_between(db, user_id, start, end)
+
+    try:
+        await crud.save_daily_rollups(db, user_id, _aggregate_ratings(ratings), _aggregate_answers(answer_dates), today)
+    except IntegrityError:
+        # Эти дни уже агрегированы параллельным запросом
+        await db.rollback()
+    return True
+
+
+async def run_daily_rollups() -> int:
+    """Догоняет дневные агрегаты всех пользователей до вчерашнего дня. Возвращает число обработанных пользователей"""
+    today = datetime.utcnow().date()
+    processed = 0
+    last_user_id = 0
+
+    async with AsyncSessionLocal() as db:
+        while True:
+            user_ids = await crud.get_users_pending_rollup(db, today, last_user_id, ROLLUP_BATCH_USERS)
+            if not user_ids:
+                break
+            for user_id in user_ids:
+                await rollup_user(db, user_id, today)
+                processed += 1
+            last_user_id = user_ids[-1]
+
+    logger.info(f"Дневные агрегаты обновлены для {processed} пользователей")
+    return processed
+
+
+async def rollup_loop():
+    """
+    Запускает удаление неактивных гостей, агрегацию, пересчет когортных метрик, очистку журнала сбросов кэшей
+    и показов вопросов за прошлые дни при старте и затем каждую ночь (в 00:05 UTC)
+    """
+    from backend.services.cohort_service import refresh_cohort_stats
+    from backend.services.guest_gc_service import run_guest_gc
+    from backend.services.cache_sync import CACHE_INVALIDATIONS_RETENTION_HOURS
+    while True:
+        try:
+            await run_guest_gc()
+            await run_daily_rollups()
+            async with AsyncSessionLocal() as db:
+                await refresh_cohort_stats(db)
+                await crud.delete_cache_invalidations(
+                    db, datetime.utcnow() - timedelta(hours=CACHE_INVALIDATIONS_RETENTION_HOURS)
+                )
+                await crud.delete_question_served_days(db, datetime.utcnow().date())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка ночной агрегации: {e}", exc_info=True)
+
+        now = datetime.utcnow()
+        next_run = datetime.combine(now.date() + timedelta(days=1), time(0, 5))
+        await asyncio.sleep((next_run - now).total_seconds())
+
+
+async def leader_loop():
+    """Дожидается блокировки ведущего воркера (или сразу получает ее) и выполняет rollup_loop"""
+    if not acquire_leader():
+        logger.info("Фоновые задачи выполняет другой воркер")
+        while not acquire_leader():
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
+        logger.info("Воркер стал ведущим, запуск фоновых задач")
+    await rollup_loop()
+
+
+def start_rollup_loop():
+    global _rollup_task
+    if _rollup_task is None or _rollup_task.done():
+        _rollup_task = asyncio.create_task(leader_loop())
+
+
+async def stop_rollup_loop():
+    global _rollup_task
+    if _rollup_task is not None and not _rollup_task.done():
+        _rollup_task.cancel()
+        await asyncio.gather(_rollup_task, return_exceptions=True)
+    _rollup_task = None
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.config import settings
+from backend.database import crud
+from backend.database.database import AsyncSessionLocal
+from backend.services import metrics
+from backend.services.cache import report_cache
+
+logger = logging.getLogger(__name__)
+
+# Операция буфера: (функция записи без коммита, ID пользователя, future для ответа запросу)
+Operation = Tuple[Callable[[AsyncSession], Awaitable[Any]], int, asyncio.Future]
+
+
+class GroupCommitBuffer:
+    """
+    Буфер записи с групповым коммитом: операции из параллельных запросов копятся до max_rows штук
+    или max_delay_ms миллисекунд и записываются одной транзакцией (один fsync SQLite на пачку).
+    Запрос получает результат только после коммита своей пачки. Если пачка не записалась,
+    операции повторяются по одной, чтобы ошибка досталась только своему запросу.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, user_id: int, apply: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        """Ставит запись в очередь и ждет коммита пачки; apply выполняется в сессии буфера и не должен коммитить"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((apply, user_id, future))
+        return await future
+
+    async def stop(self):
+        """Записывает оставшиеся операции и останавливает буфер"""
+        if self._task is not None and not self._task.done():
+            await self._queue.put(None)
+            await self._task
+        self._task = None
+        self._queue = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            operation = await self._queue.get()
+            if operation is None:
+                return
+            batch = [operation]
+            stopping = False
+            deadline = loop.time() + settings.write_buffer_max_delay_ms / 1000
+            while len(batch) < settings.write_buffer_max_rows:
+                timeout = deadline - loop.time()
+                try:
+                    operation = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if operation is None:
+                    stopping = True
+                    break
+                batch.append(operation)
+
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"Ошибка группового коммита: {e}", exc_info=True)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Operation]):
+        results = None
+        async with AsyncSessionLocal() as db:
+            try:
+                results = [await apply(db) for apply, _, _ in batch]
+                report_cache.stage_invalidation(db, {user_id for _, user_id, _ in batch})
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.warning(f"Пачка из {len(batch)} записей не записана, повтор по одной: {e}")
+                results = None
+
+        if results is None:
+            await self._flush_one_by_one(batch)
+        else:
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+        await report_cache.invalidate_many({user_id for _, user_id, _ in batch}, publish=False)
+        metrics.increment("write_buffer_batches_total")
+        metrics.increment("write_buffer_operations_total", len(batch))
+
+    async def _flush_one_by_one(self, batch: List[Operation]):
+        for apply, user_id, future in batch:
+            async with AsyncSessionLocal() as db:
+                try:
+                    result = await apply(db)
+                    report_cache.stage_invalidation(db, [user_id])
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+            if not future.done():
+                future.set_result(result)
+
+
+write_buffer = GroupCommitBuffer()
+
+
+async def create_answer(
+    db: AsyncSession,
+    user_id: int,
+    question_id: int,
+    answer: str,
+    idempotency_key: Optional[str] = None
+):
+    """Сохраняет ответ: через групповой коммит, если он включен (WRITE_BUFFER_ENABLED), иначе отдельной транзакцией"""
+    if not settings.write_buffer_enabled:
+        return await crud.create_answer(db, user_id, question_id, answer, idempotency_key)
+    return await write_buffer.submit(
+        user_id,
+        lambda session: crud.add_answer(session, user_id, question_id, answer, idempotency_key)
+    )
+
+
+async def create_user_spheres(db: AsyncSession, user_id: int, ratings: List[Tuple[str, int]]) -> list:
+    """Сохраняет оценки сфер: через групповой коммит одной операцией, если он включен, иначе по одной"""
+    if not settings.write_buffer_enabled:
+        return [await crud.create_user_sphere(db, user_id, sphere, rating) for sphere, rating in ratings]
+
+    async def apply(session: AsyncSession):
+        return [await crud.add_user_sphere(session, user_id, sphere, rating) for sphere, rating in ratings]
+
+    return await write_buffer.submit(user_id, apply)
@@ -69,6 +69,19 @@ const setGuestUserId = (userId) => {
   localStorage.setItem('guest_user_id', userId.toString())
 }
 
+// Количество попыток отправки ответа при сетевых ошибках
+const ANSWER_RETRY_ATTEMPTS = 3
+
+// Размер страницы истории ответов, подгружаемой при прокрутке (не больше ANSWERS_MAX_PAGE_SIZE на backend)
+const ANSWERS_PAGE_LIMIT = 50
+
+const generateIdempotencyKey = () => {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID()
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+}
+
 const getHeaders = () => {
   const headers = {
     'Content-Type': 'application/json',
@@ -211,22 +224,36 @@ export const api = {
   
   // Answers
   createAnswer: async (questionId, answer) => {
-    const response = await fetch(buildApiUrl('api/answers/'), {
-      method: 'POST',
-      headers: getHeaders(),
-      body: JSON.stringify({ question_id: questionId, answer })
-    })
-    return handleResponse(response)
+    // Один ключ идемпотентности на все повторы: backend не создаст дубль ответа
+    const idempotencyKey = generateIdempotencyKey()
+    for (let attempt = 1; ; attempt++) {
+      try {
+        const response = await fetch(buildApiUrl('api/answers/'), {
+          method: 'POST',
+          headers: { ...getHeaders(), 'Idempotency-Key': idempotencyKey },
+          body: JSON.stringify({ question_id: questionId, answer })
+        })
+        return handleResponse(response)
+      } catch (error) {
+        // Повторяем только сетевые ошибки (нестабильная мобильная сеть)
+        if (error.name !== 'TypeError' || attempt >= ANSWER_RETRY_ATTEMPTS) {
+          throw error
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * attempt))
+      }
+    }
   },
   
-  getAnswers: async (days = null) => {
-    const url = days 
-      ? buildApiUrl(`api/answers/?days=${days}`)
-      : buildApiUrl('api/answers/')
-    const response = await fetch(url, {
+  getAnswers: async (days = null, cursor = null) => {
+    // Одна страница истории: следующую экран запрашивает при прокрутке, передавая nextCursor
+    const params = new URLSearchParams({ limit: String(ANSWERS_PAGE_LIMIT) })
+    if (days) params.set('days', days)
+    if (cursor) params.set('cursor', cursor)
+    const response = await fetch(buildApiUrl(`api/answers/?${params}`), {
       headers: getHeaders()
     })
-    return handleResponse(response)
+    const answers = await handleResponse(response)
+    return { answers, nextCursor: response.headers.get('X-Next-Cursor') }
   },
   
   // Spheres